@@ -0,0 +1,431 @@
+# Benchmarks/bench_parse_python.py
+# Нагрузочные замеры и регрессионная проверка Python-движка метрик (MCode/Scripts/parse_python.py).
+#
+#   python Benchmarks/bench_parse_python.py                       # замер и сравнение с baseline.json
+#   python Benchmarks/bench_parse_python.py --update-baseline     # перезаписать baseline.json
+#   python Benchmarks/bench_parse_python.py --scale 0.1 --output results.json
+#
+# Исходники для замеров генерируются детерминированно (фиксированный seed), поэтому
+# число узлов и размер текста между запусками совпадают, а отличаются только времена.
+import gc
+import os
+import sys
+import json
+import time
+import random
+import platform
+import argparse
+import tempfile
+import tracemalloc
+import subprocess
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRIPTS_DIR = os.path.join(BENCH_DIR, os.pardir, 'MCode', 'Scripts')
+PARSER_SCRIPT = os.path.join(SCRIPTS_DIR, 'parse_python.py')
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, 'baseline.json')
+
+sys.path.insert(0, SCRIPTS_DIR)
+import halstead_engine # noqa: E402 - путь к Scripts добавляется выше
+
+SEED = 20240601
+DEFAULT_TOLERANCE = 0.30 # Допустимое ухудшение относительно baseline (30%)
+MIN_MEASURE_S = 1.0 # Замер повторяется, пока суммарное время не достигнет этого значения...
+MAX_REPEAT = 50     # ...но не больше этого числа повторов
+
+
+# --- Генератор синтетических исходников ---
+class SourceGenerator:
+    def __init__(self, seed=SEED):
+        self._rng = random.Random(seed)
+
+    def _name(self):
+        return self._rng.choice('abcdefghijklmnopqrstuvwxyz') + str(self._rng.randrange(1000))
+
+    def _expression(self, depth=0):
+        rng = self._rng
+        choice = rng.randrange(7 if depth < 3 else 2)
+        if choice == 0:
+            return self._name()
+        if choice == 1:
+            return str(rng.randrange(10000))
+        if choice == 2:
+            op = rng.choice(('+', '-', '*', '//', '%', '<<', '&', '|'))
+            return f"({self._expression(depth + 1)} {op} {self._expression(depth + 1)})"
+        if choice == 3:
+            return f"{self._name()}({', '.join(self._expression(depth + 1) for _ in range(rng.randrange(4)))})"
+        if choice == 4:
+            return f"{self._name()}.{self._name()}[{self._expression(depth + 1)}]"
+        if choice == 5:
+            return f"[{self._expression(depth + 1)} for {self._name()} in {self._name()} if {self._name()}]"
+        return f"{{'{self._name()}': {self._expression(depth + 1)}, 'k': ({self._expression(depth + 1)}, 1)}}"
+
+    def flat_script(self, statements):
+        lines = ["import os", "import sys", ""]
+        for _ in range(statements):
+            if self._rng.random() < 0.2:
+                lines.append(f"print({self._expression()})")
+            else:
+                lines.append(f"{self._name()} = {self._expression()}")
+        return "\n".join(lines) + "\n"
+
+    def function(self, statements):
+        rng = self._rng
+        lines = [f"def {self._name()}({', '.join(self._name() for _ in range(rng.randrange(4)))}):",
+                 '    """Generated function."""']
+        for _ in range(statements):
+            kind = rng.randrange(5)
+            if kind == 0:
+                lines.append(f"    if {self._expression()} > {self._expression()}:")
+                lines.append(f"        {self._name()} = {self._expression()}")
+                lines.append("    else:")
+                lines.append(f"        {self._name()} += 1")
+            elif kind == 1:
+                lines.append(f"    for {self._name()} in range({self._expression()}):")
+                lines.append(f"        {self._name()}.append({self._expression()})  # comment")
+            elif kind == 2:
+                lines.append("    try:")
+                lines.append(f"        {self._name()} = {self._expression()}")
+                lines.append("    except ValueError:")
+                lines.append("        pass")
+            else:
+                lines.append(f"    {self._name()} = {self._expression()}")
+        lines.append(f"    return {self._expression()}")
+        return "\n".join(lines) + "\n"
+
+    def module(self, functions, statements_per_function=12):
+        parts = ['"""Generated module."""', "import os", ""]
+        for index in range(functions):
+            if index % 5 == 0:
+                parts.append(f"class {self._name().upper()}:")
+                body = self.function(statements_per_function)
+                parts.append("\n".join("    " + line if line else line for line in body.splitlines()))
+            else:
+                parts.append(self.function(statements_per_function))
+            parts.append("")
+        return "\n".join(parts) + "\n"
+
+    def deep_nesting(self, depth):
+        # Вложенные блоки (ограничены лимитом отступов парсера) и длинная цепочка BinOp
+        lines = []
+        block_depth = min(depth, 90)
+        for level in range(block_depth):
+            lines.append("    " * level + f"if {self._name()}:")
+        lines.append("    " * block_depth + f"{self._name()} = 1")
+        lines.append("x = " + " + ".join(self._name() for _ in range(depth * 50)))
+        return "\n".join(lines) + "\n"
+
+    def huge_literals(self, items):
+        rng = self._rng
+        numbers = ", ".join(str(rng.randrange(10 ** 9)) for _ in range(items))
+        blob = "".join(rng.choice("ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789+/") for _ in range(items * 20))
+        table = ",\n".join(f"    ('{self._name()}', {rng.random():.6f}, {{'k': {rng.randrange(100)}}})"
+                           for _ in range(items // 10))
+        return f"NUMBERS = [{numbers}]\nBLOB = '{blob}'\nTABLE = [\n{table}\n]\n"
+
+
+def build_cases(scale):
+    generator = SourceGenerator()
+
+    def scaled(value):
+        return max(1, int(value * scale))
+
+    return {
+        "flat_script": generator.flat_script(scaled(5000)),
+        "deep_nesting": generator.deep_nesting(scaled(400)),
+        "huge_literals": generator.huge_literals(scaled(50000)),
+        "huge_file": generator.module(scaled(2000)),
+        # Много маленьких файлов: важны накладные расходы на файл, а не скорость обхода
+        "many_small_files": [generator.module(2, 4) for _ in range(scaled(500))],
+    }
+
+
+# --- Замеры ---
+def _best_times(functions, repeat):
+    # functions - {имя: функция}; возвращает {имя: лучшее время}.
+    # Функции, чьи времена потом делятся друг на друга, выполняются по кругу: замедление
+    # машины на время замера одинаково задевает числитель и знаменатель отношения.
+    # Как в timeit, сборщик циклов на время замера отключён: его проходы по большому
+    # дереву случайно попадают то в разбор, то в обход.
+    best = dict.fromkeys(functions)
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        rounds = 0
+        total = 0.0
+        # Короткие замеры повторяются дольше: минимум из repeat коротких прогонов слишком шумный
+        while rounds < repeat or (total < MIN_MEASURE_S * len(functions) and rounds < MAX_REPEAT):
+            for name, function in functions.items():
+                start = time.perf_counter()
+                function()
+                elapsed = time.perf_counter() - start
+                best[name] = elapsed if best[name] is None else min(best[name], elapsed)
+                total += elapsed
+            rounds += 1
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    return best
+
+
+def _count_nodes(tree):
+    return sum(1 for _ in halstead_engine.ast.walk(tree)) # ast.walk итеративен, глубина не мешает
+
+
+def _walk(engine, tree):
+    if engine == 'visitor':
+        walker = halstead_engine.HalsteadMetricsVisitor()
+        walker.visit(tree)
+    else:
+        walker = halstead_engine.TableHalsteadWalker()
+        walker.walk(tree)
+    return walker.operators, walker.operands, walker.N1, walker.N2
+
+
+def measure_source(sources, repeat):
+    # sources - один текст или список текстов (каждый анализируется отдельно)
+    if isinstance(sources, str):
+        sources = [sources]
+    trees = [halstead_engine.parse_source(source) for source in sources]
+    nodes = sum(_count_nodes(tree) for tree in trees)
+    result = {
+        "files": len(sources),
+        "source_bytes": sum(len(source.encode('utf-8')) for source in sources),
+        "nodes": nodes,
+        "walk_s": {},
+        "nodes_per_s": {},
+        "errors": {},
+    }
+
+    functions = {"parse": lambda: [halstead_engine.parse_source(s) for s in sources]}
+    reference = None
+    for engine in ('table', 'visitor'):
+        try:
+            counts = [_walk(engine, tree) for tree in trees]
+        except RecursionError:
+            # Рекурсивный эталон не справляется с глубокой вложенностью - это ожидаемо
+            result["errors"][engine] = "RecursionError"
+            continue
+        if reference is None:
+            reference = counts
+        elif counts != reference:
+            result["errors"][engine] = "MismatchWithTableEngine"
+        functions[engine] = lambda engine=engine: [_walk(engine, tree) for tree in trees]
+    functions["tokens"] = lambda: [halstead_engine.compute_analysis(s, engine='tokens', with_lines=True)
+                                   for s in sources]
+
+    timings = _best_times(functions, repeat)
+    result["parse_s"] = timings.pop("parse")
+    result["tokens_s"] = timings.pop("tokens")
+    for engine, elapsed in timings.items():
+        result["walk_s"][engine] = elapsed
+        result["nodes_per_s"][engine] = nodes / elapsed if elapsed else 0.0
+
+    # Пиковая память - отдельным прогоном: tracemalloc заметно замедляет выполнение
+    for mode, kwargs in (("ast", {"engine": 'table'}), ("tokens", {"engine": 'tokens'})):
+        tracemalloc.start()
+        for source in sources:
+            halstead_engine.compute_analysis(source, **kwargs)
+        result[f"peak_mem_{mode}_bytes"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result
+
+
+def measure_startup(sample_source, files, repeat):
+    # Сколько стоит запуск интерпретатора на каждый файл (как сейчас делает C#)
+    # по сравнению с одним долгоживущим процессом в режиме --serve.
+    with tempfile.TemporaryDirectory() as directory:
+        sample_path = os.path.join(directory, 'sample.py')
+        with open(sample_path, 'w', encoding='utf-8') as f:
+            f.write(sample_source)
+
+        requests = "".join(json.dumps({"id": i, "path": sample_path}) + "\n" for i in range(files))
+
+        def serve_batch():
+            subprocess.run([sys.executable, PARSER_SCRIPT, '--serve', '--no-cache'], input=requests,
+                           text=True, check=True, stdout=subprocess.DEVNULL)
+
+        timings = _best_times({
+            "interpreter": lambda: subprocess.run([sys.executable, '-c', 'pass'], check=True),
+            "script": lambda: subprocess.run([sys.executable, PARSER_SCRIPT, '--no-cache', sample_path],
+                                             check=True, stdout=subprocess.DEVNULL),
+            "serve": serve_batch,
+        }, repeat)
+
+    return {
+        "interpreter_s": timings["interpreter"],
+        "script_per_file_s": timings["script"],
+        "serve_per_file_s": timings["serve"] / files,
+    }
+
+
+def run_benchmarks(scale, repeat):
+    cases = build_cases(scale)
+    results = {
+        "meta": {
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "platform": platform.platform(),
+            "engine_version": halstead_engine.ENGINE_VERSION,
+            "scale": scale,
+            "repeat": repeat,
+        },
+        "cases": {},
+    }
+    for name, sources in cases.items():
+        sys.stderr.write(f"benchmark: {name}\n")
+        results["cases"][name] = measure_source(sources, repeat)
+    sys.stderr.write("benchmark: startup\n")
+    results["startup"] = measure_startup(cases["many_small_files"][0], max(1, int(200 * scale)), repeat)
+    results["ratios"] = normalized_ratios(results)
+    return results
+
+
+def _ratio(numerator, denominator):
+    return numerator / denominator if numerator is not None and denominator else None
+
+
+def normalized_ratios(results):
+    # Абсолютные времена зависят от машины и её загрузки; с baseline сравниваются отношения
+    # замеров одного прогона: обход к разбору (ast.parse), табличный движок к эталону,
+    # накладные расходы скрипта и --serve к голому запуску интерпретатора
+    ratios = {}
+    for name, result in results["cases"].items():
+        walk = result["walk_s"]
+        case = {"walk_per_parse": {engine: _ratio(elapsed, result["parse_s"])
+                                   for engine, elapsed in walk.items()},
+                "tokens_per_parse": _ratio(result["tokens_s"], result["parse_s"])}
+        if "table" in walk and "visitor" in walk:
+            case["table_per_visitor"] = _ratio(walk["table"], walk["visitor"])
+        ratios[name] = case
+    startup = results["startup"]
+    interpreter = startup["interpreter_s"]
+    ratios["startup"] = {
+        "script_overhead_per_interpreter": _ratio(startup["script_per_file_s"] - interpreter, interpreter),
+        "serve_per_file_per_interpreter": _ratio(startup["serve_per_file_s"], interpreter),
+    }
+    return ratios
+
+
+# --- Сравнение с baseline ---
+def _flatten(data, prefix=""):
+    for key, value in data.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            yield from _flatten(value, path + ".")
+        else:
+            yield path, value
+
+
+def _direction(path):
+    # -1 - чем меньше, тем лучше; 0 - должно совпадать; None - не сравнивается.
+    # Абсолютные времена (*_s, nodes_per_s) только выводятся: их шум между запусками
+    # больше допуска, регрессии ловятся по отношениям из normalized_ratios
+    parts = path.split('.')
+    if parts[0] == "ratios" or parts[-1].startswith("peak_mem_"):
+        return -1
+    if parts[-1] in ("files", "nodes", "source_bytes"):
+        return 0
+    return None
+
+
+# Поля meta, которые должны совпадать с baseline: иначе отношения замеров несравнимы
+COMPARABLE_META = ("python", "implementation", "platform", "scale", "repeat")
+
+
+def meta_differences(results, baseline):
+    meta = baseline.get("meta", {})
+    return [key for key in COMPARABLE_META if meta.get(key) != results["meta"][key]]
+
+
+# Единственная допустимая ошибка: рекурсивный эталон может не справиться с глубокой вложенностью
+EXPECTED_ERRORS = {("visitor", "RecursionError")}
+
+
+def check_errors(results):
+    # Проверяется при каждом запуске, независимо от baseline: расхождение движков или
+    # новая ошибка - всегда регрессия
+    problems = []
+    for case, result in results["cases"].items():
+        for engine, error in result["errors"].items():
+            if (engine, error) not in EXPECTED_ERRORS:
+                problems.append({"metric": f"cases.{case}.errors.{engine}", "problem": "error", "actual": error})
+    return problems
+
+
+def compare_with_baseline(results, baseline, tolerance):
+    # Возвращает список найденных регрессий; meta и errors (см. check_errors) не сравниваются
+    problems = []
+    current = dict(_flatten({k: v for k, v in results.items() if k != "meta"}))
+    for path, expected in _flatten({k: v for k, v in baseline.items() if k != "meta"}):
+        if ".errors." in path:
+            continue # Исчезнувшая ошибка (эталон стал справляться с вложенностью) - не регрессия
+        if path not in current:
+            problems.append({"metric": path, "problem": "missing", "baseline": expected})
+            continue
+        actual = current[path]
+        direction = _direction(path)
+        if direction is None:
+            continue
+        if direction == 0:
+            if actual != expected:
+                problems.append({"metric": path, "problem": "changed", "baseline": expected, "actual": actual})
+        elif isinstance(expected, (int, float)) and expected > 0 and actual is not None:
+            ratio = actual / expected
+            if ratio > 1 + tolerance:
+                problems.append({"metric": path, "problem": "regression", "baseline": expected,
+                                 "actual": actual, "ratio": round(ratio, 3)})
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks for MCode/Scripts/parse_python.py")
+    parser.add_argument("--scale", type=float, default=1.0,
+                        help="size multiplier for generated sources (default: %(default)s)")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="minimum repetitions per measurement; short ones are repeated for about "
+                             f"{MIN_MEASURE_S:g} s, the best time is kept (default: %(default)s)")
+    parser.add_argument("--output", default=None,
+                        help="write results as JSON to this file (default: stdout)")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE,
+                        help="baseline JSON to compare with (default: Benchmarks/baseline.json)")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="allowed relative slowdown before a metric is reported (default: %(default)s)")
+    parser.add_argument("--update-baseline", action="store_true",
+                        help="store the results as the new baseline instead of comparing")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.scale, args.repeat)
+    errors = check_errors(results)
+
+    if args.update_baseline and not errors:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write("\n")
+        return 0
+
+    problems = list(errors)
+    if not args.update_baseline and os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        differences = meta_differences(results, baseline)
+        if not differences:
+            problems += compare_with_baseline(results, baseline, args.tolerance)
+        else:
+            sys.stderr.write(f"baseline was recorded with a different {', '.join(differences)}, "
+                             "comparison skipped\n")
+    results["regressions"] = problems
+
+    text = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    for problem in problems:
+        sys.stderr.write(f"REGRESSION {problem}\n")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
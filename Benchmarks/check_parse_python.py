@@ -0,0 +1,262 @@
+# Benchmarks/check_parse_python.py
+# Проверка эквивалентности движков parse_python.py на корпусе исходников: табличный
+# обходчик и эталонный visitor, сбор метрик по областям, инкрементальный режим после
+# случайных правок (удаление, повтор и вставка фрагментов, границы внутри строк и скобок),
+# а также матрица схожести halstead_matrix против формул MetricResult/MetricAnalyzer из C#.
+#
+#   python Benchmarks/check_parse_python.py                  # вся стандартная библиотека
+#   python Benchmarks/check_parse_python.py path/to/src --limit 500
+#
+# Код возврата 1, если хотя бы одна проверка не прошла; расхождения печатаются в stderr.
+import os
+import sys
+import math
+import zlib
+import random
+import argparse
+import warnings
+import sysconfig
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRIPTS_DIR = os.path.join(BENCH_DIR, os.pardir, 'MCode', 'Scripts')
+
+sys.path.insert(0, SCRIPTS_DIR)
+import halstead_engine # noqa: E402 - путь к Scripts добавляется выше
+import halstead_incremental # noqa: E402
+
+SEED = 20240601
+DEFAULT_EDITS = 3 # Правок на файл в проверке инкрементального режима
+MATRIX_CORPUS_FILES = 200 # Файлов корпуса в матрице: эталон считает все пары по одной
+MATRIX_BLOCK_ROWS = 7 # Меньше числа записей, чтобы проверить и расчёт по блокам
+
+# (n1, n2, N1, N2) для граничных случаев, где метрики C# не определены (NaN) или равны 0
+MATRIX_CASES = (
+    (0, 0, 0, 0),       # Пустой файл: все метрики 0, L', D и E - NaN
+    (5, 0, 7, 0),       # n2 == 0: D - NaN; N2 == 0: L' и E - NaN
+    (0, 3, 0, 4),       # n1 == 0: L' и E - NaN
+    (3, 4, 10, 0),      # N2 == 0 при n2 > 0
+    (1, 0, 1, 0),       # n <= 1: V == 0
+    (1, 1, 1, 1),
+    (2, 2, 5, 5),
+    (3, 3, 3, 3),
+    (10, 20, 100, 150),
+    (12, 18, 90, 160),
+    (12, 18, 90, 160),  # Совпадающие записи вне диагонали
+    (40, 120, 900, 1300),
+)
+
+# Вставки на границе фрагментов верхнего уровня. Часть из них содержит строки без
+# отступа внутри многострочных строк и скобок: эвристика split_top_level режет там
+# файл неверно, и фрагменты должны быть объединены.
+INSERTIONS = (
+    'inserted_value = compute(1, 2)\n',
+    'TEMPLATE = """\ndef not_a_function():\n    return 1\nclass NotAClass:\n"""\n',
+    "QUOTED = \'\'\'\nx = 1\n\'\'\'\n",
+    'TABLE = [\n1,\n    2,\nother_name,\n]\n',
+    'def inserted(a,\nb):\n    return (a +\nb)\n',
+    '@decorator\ndef decorated():\n    pass\n',
+    'if flag:\n    value = 1\nelse:\n    value = 2\n',
+)
+
+
+def iter_corpus(inputs, limit=None):
+    # (путь, исходный текст) для файлов, которые читаются и разбираются; остальные пропускаются
+    count = 0
+    for path in halstead_engine.iter_source_paths(inputs):
+        if not isinstance(path, str):
+            continue # Элементы архивов не проверяем
+        try:
+            source = halstead_engine.read_source_file(path)
+            halstead_engine.parse_source(source)
+        except (OSError, ValueError, SyntaxError, RecursionError):
+            continue
+        yield path, source
+        count += 1
+        if limit is not None and count >= limit:
+            return
+
+
+def _counts(walker):
+    return walker.operators, walker.operands, walker.N1, walker.N2
+
+
+def check_engines(source):
+    # Табличный обходчик должен давать ровно тот же результат, что и эталонный visitor
+    tree = halstead_engine.parse_source(source)
+    table = halstead_engine.TableHalsteadWalker()
+    table.walk(tree)
+    visitor = halstead_engine.HalsteadMetricsVisitor()
+    try:
+        visitor.visit(tree)
+    except RecursionError:
+        return [] # Рекурсивный эталон не справляется с глубокой вложенностью - сравнивать не с чем
+    if _counts(table) != _counts(visitor):
+        return ["table engine differs from visitor"]
+    return []
+
+
+def check_scopes(source):
+    # Сбор метрик по областям не должен менять итоги модуля, а каждая область
+    # должна содержать метрики всех вложенных в неё областей
+    tree = halstead_engine.parse_source(source)
+    plain = halstead_engine.TableHalsteadWalker()
+    plain.walk(tree)
+    scoped = halstead_engine.TableHalsteadWalker(scopes=True)
+    scoped.walk(tree)
+    problems = []
+    if _counts(scoped) != _counts(plain):
+        problems.append("module totals with scopes=True differ from the plain walk")
+    scopes = scoped.scopes
+    for outer in scopes:
+        for inner in scopes:
+            if inner["qualname"].startswith(outer["qualname"] + ".") and \
+                    (outer["lineno"], outer["col_offset"]) <= (inner["lineno"], inner["col_offset"]) and \
+                    inner["end_lineno"] <= outer["end_lineno"]:
+                if inner["N1"] > outer["N1"] or inner["N2"] > outer["N2"] or \
+                        not set(inner["operands"]) <= set(outer["operands"]):
+                    problems.append(f"scope {outer['qualname']} does not include {inner['qualname']}")
+    return problems
+
+
+def _analysis_outcome(analyze):
+    # Результат анализа или тип ошибки: синтаксические ошибки должны совпадать так же, как метрики
+    try:
+        analysis = analyze()
+    except SyntaxError:
+        return "SyntaxError"
+    return (set(analysis["operators"]), set(analysis["operands"]), analysis["N1"], analysis["N2"])
+
+
+def _random_edit(rng, source):
+    chunks = [text for _, text in halstead_incremental.split_top_level(source)]
+    kind = rng.randrange(3)
+    if kind == 0 and len(chunks) > 1:
+        del chunks[rng.randrange(len(chunks))]
+    elif kind == 1 and chunks:
+        chunks.insert(rng.randrange(len(chunks) + 1), chunks[rng.randrange(len(chunks))]) # Повтор фрагмента
+    else:
+        chunks.insert(rng.randrange(len(chunks) + 1), rng.choice(INSERTIONS))
+    if chunks and not chunks[-1].endswith('\n'):
+        chunks[-1] += '\n'
+    return ''.join(chunks)
+
+
+def check_incremental(source, path, edits):
+    # После каждой правки инкрементальный результат должен совпадать с полным анализом
+    rng = random.Random(SEED ^ zlib.crc32(path.encode('utf-8', 'surrogatepass')))
+    key = "check:" + path
+    problems = []
+    try:
+        for step in range(edits + 1):
+            if step:
+                source = _random_edit(rng, source)
+            expected = _analysis_outcome(lambda: halstead_engine.compute_analysis(source))
+            actual = _analysis_outcome(lambda: halstead_engine.compute_incremental_analysis(key, source))
+            if actual != expected:
+                problems.append(f"incremental result differs from full analysis after edit {step}")
+                break
+    finally:
+        halstead_engine._incremental_analyzer.forget(key)
+    return problems
+
+
+def _csharp_metrics(n1, n2, N1, N2):
+    # Перенос MetricResult: (значение, сравнение в логарифмической шкале) в порядке MetricAnalyzer.Compare
+    vocabulary = n1 + n2
+    length = N1 + N2
+    volume = 0.0 if vocabulary <= 1 or length == 0 else length * math.log(vocabulary, 2.0)
+    level = math.nan if n1 == 0 or N2 == 0 else (2.0 * n2) / (n1 * N2)
+    effort = math.nan if math.isnan(level) or level == 0 else volume / level
+    difficulty = math.nan if n2 == 0 else (n1 / 2.0) * (N2 / n2)
+    return ((n1, False), (n2, False), (N1, True), (N2, True), (volume, True), (difficulty, False), (effort, True))
+
+
+def _csharp_component(val1, val2, use_log):
+    # Перенос MetricAnalyzer.CalculateComponentSimilarity
+    if math.isnan(val1) or math.isnan(val2):
+        return math.nan
+    if use_log:
+        val1 = math.log(val1 + 1)
+        val2 = math.log(val2 + 1)
+    max_val = max(abs(val1), abs(val2))
+    if max_val == 0:
+        return 100.0
+    return max(0.0, (1.0 - abs(val1 - val2) / max_val) * 100.0)
+
+
+def _csharp_similarity(counts1, counts2):
+    components = [_csharp_component(val1, val2, use_log) for (val1, use_log), (val2, _)
+                  in zip(_csharp_metrics(*counts1), _csharp_metrics(*counts2))]
+    valid = [similarity for similarity in components if not math.isnan(similarity)]
+    return sum(valid) / len(valid) if valid else 0.0
+
+
+def check_matrix(counts):
+    # counts - список (n1, n2, N1, N2); векторизованная матрица должна совпадать с попарным расчётом C#
+    try:
+        import halstead_matrix
+    except ImportError as e:
+        sys.stderr.write(f"matrix check skipped, NumPy is not available: {e}\n")
+        return []
+    records = [{"operators": [None] * n1, "operands": [None] * n2, "N1": N1, "N2": N2}
+               for n1, n2, N1, N2 in counts]
+    metrics = halstead_matrix.metric_vectors(records)
+    matrix = halstead_matrix.similarity_matrix(metrics, block_rows=MATRIX_BLOCK_ROWS)
+    problems = []
+    for i, counts1 in enumerate(counts):
+        for j, counts2 in enumerate(counts):
+            expected = _csharp_similarity(counts1, counts2)
+            if not math.isclose(float(matrix[i, j]), expected, abs_tol=1e-3):
+                problems.append(f"similarity of {counts1} and {counts2} is {float(matrix[i, j]):.4f}, "
+                                f"C# gives {expected:.4f}")
+    return problems
+
+
+CHECKS = (
+    ("engines", check_engines),
+    ("scopes", check_scopes),
+)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Equivalence checks for MCode/Scripts/parse_python.py")
+    parser.add_argument("paths", nargs="*",
+                        help="files, directories or glob patterns (default: the standard library)")
+    parser.add_argument("--limit", type=int, default=None,
+                        help="check at most this many files")
+    parser.add_argument("--edits", type=int, default=DEFAULT_EDITS,
+                        help="random edits per file for the incremental check (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    # Тесты стандартной библиотеки намеренно содержат неверные escape-последовательности
+    warnings.simplefilter("ignore", SyntaxWarning)
+    inputs = args.paths or [sysconfig.get_paths()["stdlib"]]
+    files = 0
+    failures = 0
+    matrix_counts = list(MATRIX_CASES)
+    for path, source in iter_corpus(inputs, args.limit):
+        files += 1
+        results = [(name, check(source)) for name, check in CHECKS]
+        results.append(("incremental", check_incremental(source, path, args.edits)))
+        for name, problems in results:
+            for problem in problems:
+                failures += 1
+                sys.stderr.write(f"FAIL {name} {path}: {problem}\n")
+        if files <= MATRIX_CORPUS_FILES:
+            analysis = halstead_engine.compute_analysis(source)
+            matrix_counts.append((len(analysis["operators"]), len(analysis["operands"]),
+                                  analysis["N1"], analysis["N2"]))
+
+    for problem in check_matrix(matrix_counts):
+        failures += 1
+        sys.stderr.write(f"FAIL matrix: {problem}\n")
+
+    print(f"checked {files} files, {failures} failures")
+    if files == 0:
+        sys.stderr.write("no files to check\n")
+        return 1
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
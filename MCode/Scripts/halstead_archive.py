@@ -0,0 +1,73 @@
+# Scripts/halstead_archive.py
+# Чтение исходников прямо из архивов .zip и .tar(.gz/.bz2/.xz) без распаковки на диск.
+# Элементы читаются последовательно, по одному; декодированный текст сразу отдаётся дальше.
+import io
+import fnmatch
+import tarfile
+import zipfile
+
+ARCHIVE_SUFFIXES = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+DEFAULT_MEMBER_PATTERN = '*.py'
+DEFAULT_MAX_MEMBER_BYTES = 64 * 1024 * 1024 # Защита от «архивных бомб»: больший элемент - ошибка
+
+
+class MemberTooLargeError(ValueError):
+    pass
+
+
+def is_archive(path):
+    return path.lower().endswith(ARCHIVE_SUFFIXES)
+
+
+def member_path(archive_path, name):
+    # Путь элемента в результатах: архив и имя внутри него через '!' (как в URL jar:)
+    return f"{archive_path}!{name}"
+
+
+def decode_source(data):
+    # Тот же результат, что при open(..., 'r', encoding='utf-8'): UTF-8 и универсальные переводы строк
+    with io.TextIOWrapper(io.BytesIO(data), encoding='utf-8') as text:
+        return text.read()
+
+
+def iter_archive_sources(archive_path, pattern=DEFAULT_MEMBER_PATTERN, max_member_bytes=DEFAULT_MAX_MEMBER_BYTES):
+    # Выдаёт (путь элемента, исходный текст) для элементов, подходящих под pattern.
+    # Ошибка чтения элемента выдаётся вместо текста (исключение), ошибка всего архива -
+    # одним элементом с путём архива; обход остальных элементов при этом продолжается.
+    try:
+        if archive_path.lower().endswith('.zip'):
+            yield from _iter_zip(archive_path, pattern, max_member_bytes)
+        else:
+            yield from _iter_tar(archive_path, pattern, max_member_bytes)
+    except (OSError, zipfile.BadZipFile, tarfile.TarError, EOFError) as e:
+        yield archive_path, e
+
+
+def _read_member(name, size, max_member_bytes, read):
+    if size > max_member_bytes:
+        return MemberTooLargeError(f"Archive member '{name}' is {size} bytes, limit is {max_member_bytes}")
+    try:
+        return decode_source(read())
+    except (UnicodeDecodeError, OSError, zipfile.BadZipFile, tarfile.TarError, EOFError) as e:
+        return e
+
+
+def _iter_zip(archive_path, pattern, max_member_bytes):
+    with zipfile.ZipFile(archive_path) as archive:
+        for info in archive.infolist():
+            if info.is_dir() or not fnmatch.fnmatch(info.filename, pattern):
+                continue
+            source = _read_member(info.filename, info.file_size, max_member_bytes,
+                                  lambda: archive.read(info))
+            yield member_path(archive_path, info.filename), source
+
+
+def _iter_tar(archive_path, pattern, max_member_bytes):
+    # Потоковый режим 'r|*': сжатый архив читается один раз от начала до конца, без перемотки
+    with tarfile.open(archive_path, mode='r|*') as archive:
+        for member in archive:
+            if not member.isfile() or not fnmatch.fnmatch(member.name, pattern):
+                continue
+            source = _read_member(member.name, member.size, max_member_bytes,
+                                  lambda: archive.extractfile(member).read())
+            yield member_path(archive_path, member.name), source
@@ -0,0 +1,201 @@
+# Scripts/halstead_cache.py
+# Постоянный кэш результатов parse_python.py, адресуемый содержимым файла.
+import os
+import sys
+import json
+import time
+import sqlite3
+import atexit
+import hashlib
+import contextlib
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024 # 256 МБ на диске под результаты
+SCHEMA_VERSION = 1 # Хранится в PRAGMA user_version: схема создаётся только для новой базы
+# Счётчики попаданий/промахов и время последнего обращения к прочитанным записям копятся
+# в памяти и сбрасываются в базу не чаще, чем раз в COUNTERS_FLUSH_INTERVAL секунд или
+# раз в COUNTERS_FLUSH_EVERY обращений, а также перед каждой записью (put)
+COUNTERS_FLUSH_INTERVAL = 5.0
+COUNTERS_FLUSH_EVERY = 256
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_last_access ON entries(last_access);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO meta(key, value) VALUES ('hits', 0), ('misses', 0), ('evictions', 0), ('total_size', 0);
+"""
+
+
+def default_cache_path():
+    # %LOCALAPPDATA% на Windows, $XDG_CACHE_HOME или ~/.cache в остальных системах
+    base = os.environ.get('LOCALAPPDATA') or os.environ.get('XDG_CACHE_HOME') \
+        or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'MCode', 'parse_python_cache.sqlite3')
+
+
+class ResultCache:
+    """LRU-кэш результатов анализа (любых JSON-сериализуемых значений) в файле SQLite.
+
+    Ключ - SHA-256 от версии движка, версии Python и байтов исходного кода,
+    поэтому изменение любого из них автоматически даёт промах.
+    """
+
+    def __init__(self, path, namespace, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._namespace = namespace.encode('utf-8') + b'\0'
+        self.hits = 0    # Счётчики текущего процесса; суммарные хранятся в таблице meta
+        self.misses = 0
+        self._pending_hits = 0   # Ещё не записанные в meta
+        self._pending_misses = 0
+        self._touched = {} # Ключ -> время последнего попадания, ещё не записанное в last_access
+        self._last_flush = time.monotonic()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # timeout - ожидание блокировки, когда в кэш одновременно пишут процессы пула
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        if self._conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            self._conn.execute("PRAGMA journal_mode=WAL") # Режим WAL сохраняется в самом файле
+            self._conn.executescript(_SCHEMA)
+            self._conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        atexit.register(self.close) # Сбросить накопленные счётчики при обычном завершении
+
+    def make_key(self, source_bytes):
+        return hashlib.sha256(self._namespace + source_bytes).hexdigest()
+
+    def get(self, key):
+        # Только чтение: при параллельной работе процессов пула попадания не должны
+        # выстраиваться в очередь за блокировкой на запись
+        row = self._conn.execute("SELECT value FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            self._pending_misses += 1
+        else:
+            self.hits += 1
+            self._pending_hits += 1
+            self._touched[key] = time.time()
+        if (self._pending_hits + self._pending_misses >= COUNTERS_FLUSH_EVERY
+                or time.monotonic() - self._last_flush >= COUNTERS_FLUSH_INTERVAL):
+            self.flush_counters()
+        return None if row is None else json.loads(row[0])
+
+    def flush_counters(self):
+        # Записывает накопленные счётчики и время обращений одной транзакцией
+        self._last_flush = time.monotonic()
+        if not (self._pending_hits or self._pending_misses):
+            return
+        with self._write_transaction():
+            self._write_pending()
+
+    def _write_pending(self):
+        # Вызывается внутри транзакции на запись. Если она откатится, накопленное теряется:
+        # счётчики и так приблизительные, а last_access влияет лишь на порядок вытеснения
+        hits, misses, touched = self._pending_hits, self._pending_misses, self._touched
+        self._pending_hits = 0
+        self._pending_misses = 0
+        self._touched = {}
+        if hits:
+            self._conn.execute("UPDATE meta SET value = value + ? WHERE key = 'hits'", (hits,))
+        if misses:
+            self._conn.execute("UPDATE meta SET value = value + ? WHERE key = 'misses'", (misses,))
+        if touched:
+            # max: другой процесс мог уже перезаписать запись позже нашего чтения
+            self._conn.executemany("UPDATE entries SET last_access = max(last_access, ?) WHERE key = ?",
+                                   [(accessed, key) for key, accessed in touched.items()])
+
+    def put(self, key, result):
+        value = json.dumps(result).encode('utf-8')
+        with self._write_transaction():
+            # Сначала время обращений: только что прочитанная запись не должна быть вытеснена как старая
+            self._last_flush = time.monotonic()
+            self._write_pending()
+            old = self._conn.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries(key, value, size, last_access) VALUES (?, ?, ?, ?)",
+                (key, value, len(value), time.time()))
+            delta = len(value) - (old[0] if old else 0)
+            self._conn.execute("UPDATE meta SET value = value + ? WHERE key = 'total_size'", (delta,))
+            self._evict_if_needed()
+
+    @contextlib.contextmanager
+    def _write_transaction(self):
+        # BEGIN IMMEDIATE сразу берёт блокировку на запись: при параллельной работе
+        # процессов пула это исключает взаимную блокировку при повышении уровня транзакции.
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+
+    def _evict_if_needed(self):
+        total = self._meta('total_size')
+        if total <= self.max_bytes:
+            return
+        # Удаляем самые давно использованные записи порциями, пока не уложимся в лимит
+        evicted = 0
+        freed = 0
+        while total - freed > self.max_bytes:
+            victims = self._conn.execute(
+                "SELECT key, size FROM entries ORDER BY last_access LIMIT 256").fetchall()
+            if not victims:
+                break
+            for key, size in victims:
+                if total - freed <= self.max_bytes:
+                    break
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                freed += size
+                evicted += 1
+        self._conn.execute("UPDATE meta SET value = value - ? WHERE key = 'total_size'", (freed,))
+        self._conn.execute("UPDATE meta SET value = value + ? WHERE key = 'evictions'", (evicted,))
+
+    def _meta(self, key):
+        return self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()[0]
+
+    def stats(self):
+        self.flush_counters()
+        entries = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        return {
+            "path": self.path,
+            "entries": entries,
+            "size_bytes": self._meta('total_size'),
+            "max_bytes": self.max_bytes,
+            "hits": self._meta('hits'),
+            "misses": self._meta('misses'),
+            "evictions": self._meta('evictions'),
+        }
+
+    def close(self):
+        if self._conn is None:
+            return
+        try:
+            self.flush_counters()
+        except sqlite3.Error:
+            pass # Счётчики - только статистика
+        self._conn.close()
+        self._conn = None
+        atexit.unregister(self.close)
+
+
+def open_cache(path, namespace, max_bytes=DEFAULT_MAX_BYTES):
+    # Кэш - только ускорение: если его нельзя открыть (нет прав, занят, повреждён),
+    # работаем без него и ничего не пишем в stderr, т.к. C# считает stderr ошибкой.
+    try:
+        return ResultCache(path, namespace, max_bytes)
+    except (sqlite3.Error, OSError):
+        return None
+
+
+def python_version_tag():
+    return "%d.%d.%d" % sys.version_info[:3]
@@ -0,0 +1,1533 @@
+# Scripts/halstead_engine.py
+# Реализация parse_python.py: движки подсчёта метрик Холстеда и режимы командной строки.
+import sys
+import ast
+import json
+import io
+import keyword
+import token
+import argparse
+import os
+import glob
+import time
+# Остальные модули (tokenize, sqlite3, hashlib, threading, halstead_*) импортируются
+# там, где нужны: запуск на один файл из C# не должен платить за чужие режимы
+
+# Версия движка подсчёта метрик. Входит в ключ кэша результатов:
+# увеличивайте её при любом изменении правил подсчёта операторов/операндов.
+ENGINE_VERSION = "3"
+# Версия формата записи в кэше (1 - список, 2 - словарь, см. compute_analysis).
+# Увеличивайте её при любом изменении структуры кэшируемого значения.
+CACHE_FORMAT_VERSION = "2"
+
+# Ключевые слова, которые однозначно считаются операторами
+PYTHON_KEYWORD_OPERATORS = {
+    'if', 'else', 'elif', 'for', 'while', 'try', 'except', 'finally', 'with', 'as',
+    'def', 'class', 'return', 'yield', 'lambda', 'import', 'from', 'pass',
+    'break', 'continue', 'global', 'nonlocal', 'assert', 'del', 'raise',
+    'and', 'or', 'not', 'is', 'in', # 'is not' и 'not in' - узлы Compare с соответствующими типами
+    'async', 'await', 'yield from'
+}
+
+class HalsteadMetricsVisitor(ast.NodeVisitor):
+    def __init__(self):
+        self.operators = set()
+        self.operands = set()
+        self.N1 = 0  # Total operators count
+        self.N2 = 0  # Total operands count
+
+    def _add_operator(self, op_name):
+        self.operators.add(op_name)
+        self.N1 += 1
+
+    def _add_operand(self, operand_value_or_node):
+        name_str = ""
+        if isinstance(operand_value_or_node, ast.Name):
+            name_str = operand_value_or_node.id
+        elif isinstance(operand_value_or_node, ast.Constant): # Python 3.8+
+            name_str = str(operand_value_or_node.value) # У Constant значение в .value
+        elif isinstance(operand_value_or_node, ast.Constant): # Python < 3.8
+            name_str = str(getattr(operand_value_or_node, 'n', getattr(operand_value_or_node, 's', None)))
+        elif isinstance(operand_value_or_node, ast.Constant): # Python < 3.8 for True, False, None
+             name_str = str(operand_value_or_node.value)
+        else: # Предполагаем, что это уже строка (например, для node.attr из Attribute)
+            name_str = str(operand_value_or_node)
+
+        # Не добавляем ключевые слова-операторы в операнды
+        if name_str not in PYTHON_KEYWORD_OPERATORS:
+            self.operands.add(name_str)
+            self.N2 += 1
+
+    # --- Обработка идентификаторов и литералов (операнды) ---
+    def visit_Name(self, node):
+        # Имена (переменные, функции, классы и т.д., когда они используются, а не объявляются)
+        # Если имя - это ключевое слово-оператор, оно будет добавлено через свой visit_ метод
+        if node.id not in PYTHON_KEYWORD_OPERATORS:
+             # True, False, None обрабатываются как константы
+            if node.id not in ('True', 'False', 'None'):
+                self._add_operand(node) # Передаем узел Name
+        self.generic_visit(node) # Посещаем дочерние узлы, если есть
+
+    def visit_Constant(self, node): # Python 3.8+ (числа, строки, True, False, None, Ellipsis)
+        self._add_operand(node) # Передаем узел Constant
+        self.generic_visit(node)
+
+    # Для совместимости с Python < 3.8 (если ast.Constant не покрывает)
+    def visit_Num(self, node): self._add_operand(node); self.generic_visit(node)
+    def visit_Str(self, node): self._add_operand(node); self.generic_visit(node)
+    def visit_Bytes(self, node): self._add_operand(node); self.generic_visit(node)
+    def visit_NameConstant(self, node): self._add_operand(node); self.generic_visit(node) # True, False, None
+
+    # --- Обработка операторов ---
+    _bin_op_map = { ast.Add: '+', ast.Sub: '-', ast.Mult: '*', ast.Div: '/', ast.FloorDiv: '//', ast.Mod: '%', ast.Pow: '**', ast.LShift: '<<', ast.RShift: '>>', ast.BitOr: '|', ast.BitXor: '^', ast.BitAnd: '&', ast.MatMult: '@'}
+    def visit_BinOp(self, node):
+        self._add_operator(self._bin_op_map.get(type(node.op), type(node.op).__name__))
+        self.generic_visit(node)
+
+    _unary_op_map = { ast.USub: 'u-', ast.UAdd: 'u+', ast.Invert: '~', ast.Not: 'not_op'} # not_op, т.к. not - ключевое слово
+    def visit_UnaryOp(self, node):
+        op_name = self._unary_op_map.get(type(node.op), type(node.op).__name__)
+        # 'not' как ключевое слово уже есть в PYTHON_KEYWORD_OPERATORS
+        # Здесь мы ловим именно узел UnaryOp с операцией Not
+        if type(node.op) is ast.Not and 'not' in PYTHON_KEYWORD_OPERATORS:
+            # Уже будет посчитано через visit_Name или при обходе ключевых слов, если бы мы делали это отдельно.
+            # Для надежности, считаем здесь, т.к. 'not' - явный унарный оператор.
+             self._add_operator('not') # или 'not_unary' для различения
+        else:
+            self._add_operator(op_name)
+        self.generic_visit(node)
+
+    _compare_op_map = { ast.Eq: '==', ast.NotEq: '!=', ast.Lt: '<', ast.LtE: '<=', ast.Gt: '>', ast.GtE: '>=', ast.Is: 'is', ast.IsNot: 'is not', ast.In: 'in', ast.NotIn: 'not in'}
+    def visit_Compare(self, node):
+        # В выражении a < b < c будет несколько операторов в node.ops
+        for op_node in node.ops:
+            op_name = self._compare_op_map.get(type(op_node), type(op_node).__name__)
+            self._add_operator(op_name)
+        self.generic_visit(node)
+
+    _bool_op_map = {ast.And: 'and', ast.Or: 'or'}
+    def visit_BoolOp(self, node): # and, or
+        # Эти ключевые слова также есть в PYTHON_KEYWORD_OPERATORS.
+        # Их обработка здесь гарантирует, что они считаются операторами.
+        self._add_operator(self._bool_op_map.get(type(node.op), type(node.op).__name__))
+        self.generic_visit(node)
+
+    def visit_Assign(self, node): self._add_operator('='); self.generic_visit(node)
+
+    _aug_assign_map = { ast.Add: '+=', ast.Sub: '-=', ast.Mult: '*=', ast.Div: '/=', ast.FloorDiv: '//=', ast.Mod: '%=', ast.Pow: '**=', ast.LShift: '<<=', ast.RShift: '>>=', ast.BitOr: '|=', ast.BitXor: '^=', ast.BitAnd: '&=' , ast.MatMult: '@='}
+    def visit_AugAssign(self, node):
+        self._add_operator(self._aug_assign_map.get(type(node.op), type(node.op).__name__ + '='))
+        self.generic_visit(node)
+
+    def visit_Call(self, node):
+        self._add_operator('()') # Оператор вызова функции/метода
+        # Имя функции (node.func) и аргументы (node.args, node.keywords) будут обработаны через generic_visit
+        self.generic_visit(node)
+        
+    def visit_Attribute(self, node): # object.attribute
+        self._add_operator('.') # Оператор доступа к атрибуту
+        # node.value (то, что слева от точки) будет обработано generic_visit
+        # node.attr (имя атрибута справа, строка) добавляем как операнд
+        self._add_operand(node.attr)
+        self.generic_visit(node.value) # Обходим только левую часть, т.к. attr - строка
+
+    def visit_Subscript(self, node): # object[index]
+        self._add_operator('[]') # Оператор индексации/среза
+        self.generic_visit(node)
+
+    # --- Ключевые слова-операторы (обрабатываем узлы AST, соответствующие этим словам) ---
+    def visit_If(self, node): self._add_operator('if'); self.generic_visit(node)
+    # 'else' является частью структуры If (node.orelse), но само слово 'else' важно
+    # Если orelse не пусто, значит, есть 'else' или 'elif'
+    # ast не имеет отдельного узла для 'else' или 'elif' вне If.
+    # Если node.orelse есть и это не просто один узел If (для elif), то это 'else'.
+    # Мы уже добавили 'if'. Если есть orelse, и он не пуст, это подразумевает 'else' или 'elif'.
+    # 'elif' - это просто вложенный If в orelse.
+    # Для простоты, 'if' уже посчитан. Наличие orelse можно считать сигналом 'else'.
+    # Но чтобы не считать дважды для elif, оставим только 'if'.
+    # Альтернатива: в visit_If проверять node.orelse и если непусто и не является ast.If, добавлять 'else'.
+
+    def visit_For(self, node): self._add_operator('for'); self.generic_visit(node)
+    def visit_AsyncFor(self, node): self._add_operator('async for'); self.generic_visit(node) # async for
+    def visit_While(self, node): self._add_operator('while'); self.generic_visit(node)
+    def visit_Try(self, node): self._add_operator('try'); self.generic_visit(node)
+    # 'finally' и 'except' являются частями Try
+    def visit_ExceptHandler(self, node): self._add_operator('except'); self.generic_visit(node) # Блок except
+    # Узел Try имеет finalbody для finally
+
+    def visit_With(self, node): self._add_operator('with'); self.generic_visit(node)
+    def visit_AsyncWith(self, node): self._add_operator('async with'); self.generic_visit(node) # async with
+
+    def visit_FunctionDef(self, node): self._add_operator('def'); self.generic_visit(node)
+    def visit_AsyncFunctionDef(self, node): self._add_operator('async def'); self.generic_visit(node)
+    def visit_ClassDef(self, node): self._add_operator('class'); self.generic_visit(node)
+
+    def visit_Return(self, node): self._add_operator('return'); self.generic_visit(node)
+    def visit_Yield(self, node): self._add_operator('yield'); self.generic_visit(node)
+    def visit_YieldFrom(self, node): self._add_operator('yield from'); self.generic_visit(node)
+    def visit_Lambda(self, node): self._add_operator('lambda'); self.generic_visit(node)
+
+    def visit_Import(self, node): self._add_operator('import'); self.generic_visit(node)
+    def visit_ImportFrom(self, node): self._add_operator('from'); self.generic_visit(node) # Также содержит 'import'
+
+    def visit_Pass(self, node): self._add_operator('pass'); self.generic_visit(node)
+    def visit_Break(self, node): self._add_operator('break'); self.generic_visit(node)
+    def visit_Continue(self, node): self._add_operator('continue'); self.generic_visit(node)
+
+    def visit_Global(self, node): self._add_operator('global'); self.generic_visit(node)
+    def visit_Nonlocal(self, node): self._add_operator('nonlocal'); self.generic_visit(node)
+    def visit_Assert(self, node): self._add_operator('assert'); self.generic_visit(node)
+    def visit_Delete(self, node): self._add_operator('del'); self.generic_visit(node)
+    def visit_Raise(self, node): self._add_operator('raise'); self.generic_visit(node)
+    def visit_Await(self, node): self._add_operator('await'); self.generic_visit(node)
+
+    # --- Структурные операторы (создание коллекций, срезы, f-строки) ---
+    def visit_List(self, node): self._add_operator('list_literal[]'); self.generic_visit(node)
+    def visit_Tuple(self, node):
+        # Запятые в кортежах - тоже операторы.
+        # Если кортеж не пустой и содержит больше одного элемента, добавляем оператор ","
+        # Сам факт создания кортежа можно считать оператором 'tuple_literal()'
+        self._add_operator('tuple_literal()')
+        if len(node.elts) > 1:
+            self._add_operator(',') # Запятая как разделитель
+            self.N1 += (len(node.elts) - 2) # Если 2 элемента - 1 запятая (уже добавили), 3 эл - 2 запятых (добавляем еще N-2)
+        self.generic_visit(node)
+
+    def visit_Set(self, node): self._add_operator('set_literal{}'); self.generic_visit(node)
+    def visit_Dict(self, node):
+        self._add_operator('dict_literal{}')
+        # Двоеточия в словарях (key: value) - операторы
+        if node.keys: # Если есть ключи (и, соответственно, значения)
+            self._add_operator(':') # Оператор "ключ-значение"
+            self.N1 += (len(node.keys) - 1) # Если N ключей, то N двоеточий. Одно уже добавили.
+        self.generic_visit(node)
+    
+    def visit_Slice(self, node): # Внутри Subscript, например, a[1:2], a[:], a[1:2:3]
+        # Сам узел Slice представляет собой структуру среза.
+        # Двоеточие ':' является оператором.
+        self._add_operator(':')
+        # ast.Slice не имеет информации о количестве двоеточий, только lower, upper, step.
+        # Если есть upper (даже если lower None), значит, есть как минимум одно ':'.
+        # Если есть step (даже если lower/upper None), значит, есть как минимум одно (а то и два) ':'.
+        # Для простоты считаем один уникальный оператор ':' для срезов.
+        self.generic_visit(node)
+
+    def visit_FormattedValue(self, node): # Часть f-строки: f"{expr}"
+        self._add_operator('f{}') # Оператор форматирования в f-строке
+        self.generic_visit(node)
+    # JoinedStr (сама f-строка) не считается оператором, ее части (Constant, FormattedValue) обходятся.
+
+    # --- Генераторы и comprehensions ---
+    def visit_ListComp(self, node): self._add_operator('comp_list[]') ; self.generic_visit(node) # [x for x in ...]
+    def visit_SetComp(self, node): self._add_operator('comp_set{}')   ; self.generic_visit(node) # {x for x in ...}
+    def visit_DictComp(self, node): self._add_operator('comp_dict{:}'); self.generic_visit(node) # {k:v for k,v in ...}
+    def visit_GeneratorExp(self, node): self._add_operator('comp_gen()'); self.generic_visit(node) # (x for x in ...)
+    # Внутри comprehensions есть 'for' и 'if', которые будут обработаны соответствующими visit_ методами.
+
+    def visit_IfExp(self, node): # Тернарный оператор: value_if_true if condition else value_if_false
+        self._add_operator('if_expr'); # Можно считать 'if' и 'else' отдельно, если нужно
+        self._add_operator('else_expr');
+        self.generic_visit(node)
+
+    # Можно добавить visit_Starred для *args, **kwargs, если считать * и ** операторами распаковки.
+    def visit_Starred(self, node): # *args, *[1,2,3], **kwargs
+        # Контекст важен: в вызовах, присваиваниях и т.д.
+        # Можно считать '*' или '**' операторами здесь.
+        # Если node.value это Name, то это *имя_переменной
+        # Если в вызове, то это *args или **kwargs
+        # Для простоты, пока не будем выделять отдельный оператор для *, если он не арифметический.
+        # Он может быть частью синтаксиса аргументов функций.
+        # Если же считать его здесь, то нужно определить, что это: * или **.
+        # ast.Starred не дает информации о количестве звездочек.
+        self._add_operator('*_unpack') # Общий оператор распаковки/упаковки
+        self.generic_visit(node)
+
+
+# --- Итеративный обход с таблицей обработчиков ---
+# Считает то же самое, что HalsteadMetricsVisitor (он остаётся эталоном для сверки),
+# но без рекурсии и без поиска метода 'visit_' + имя класса для каждого узла.
+# Поэтому не падает с RecursionError на глубоко вложенном сгенерированном коде.
+
+# Узлы, для которых достаточно добавить один оператор с фиксированным именем
+_SIMPLE_OPERATOR_NODES = {
+    ast.Assign: '=', ast.Call: '()', ast.Subscript: '[]',
+    ast.If: 'if', ast.For: 'for', ast.AsyncFor: 'async for', ast.While: 'while',
+    ast.Try: 'try', ast.ExceptHandler: 'except', ast.With: 'with', ast.AsyncWith: 'async with',
+    ast.FunctionDef: 'def', ast.AsyncFunctionDef: 'async def', ast.ClassDef: 'class',
+    ast.Return: 'return', ast.Yield: 'yield', ast.YieldFrom: 'yield from', ast.Lambda: 'lambda',
+    ast.Import: 'import', ast.ImportFrom: 'from',
+    ast.Pass: 'pass', ast.Break: 'break', ast.Continue: 'continue',
+    ast.Global: 'global', ast.Nonlocal: 'nonlocal', ast.Assert: 'assert', ast.Delete: 'del',
+    ast.Raise: 'raise', ast.Await: 'await',
+    ast.List: 'list_literal[]', ast.Set: 'set_literal{}', ast.Slice: ':', ast.FormattedValue: 'f{}',
+    ast.ListComp: 'comp_list[]', ast.SetComp: 'comp_set{}', ast.DictComp: 'comp_dict{:}',
+    ast.GeneratorExp: 'comp_gen()', ast.Starred: '*_unpack',
+}
+
+# Поля, в которых не бывает узлов с обработчиками или потомками: контекст, коды операций
+# и строковые/числовые атрибуты. Для остальных полей список строится один раз на класс узла.
+# 'name' не пропускается: в Python 3.12+ у TypeAlias это узел Name, а строковые значения
+# других узлов и так отбрасываются проверкой isinstance(value, AST) при обходе.
+_SKIPPED_FIELDS = frozenset(('ctx', 'op', 'ops', 'id', 'attr', 'arg', 'asname',
+                             'module', 'level', 'kind', 'conversion', 'type_comment', 'is_async'))
+_child_fields_cache = {}
+
+
+def _child_fields(cls):
+    fields = _child_fields_cache.get(cls)
+    if fields is None:
+        fields = tuple(f for f in cls._fields if f not in _SKIPPED_FIELDS)
+        _child_fields_cache[cls] = fields
+    return fields
+
+
+# Узлы, открывающие собственную область видимости для метрик по функциям и классам
+_SCOPE_NODES = {
+    ast.ClassDef: 'class',
+    ast.FunctionDef: 'function',
+    ast.AsyncFunctionDef: 'function',
+    ast.Lambda: 'lambda',
+}
+
+# Маркер в стеке обхода: все потомки текущей области уже обработаны
+_EXIT_SCOPE = object()
+
+
+class TableHalsteadWalker:
+    def __init__(self, scopes=False, multisets=False, operand_collection=None):
+        # При multisets=True операторы и операнды собираются в мультимножества (Counter),
+        # чтобы частичные результаты можно было складывать и вычитать (инкрементальный режим).
+        # operand_collection - фабрика множества операндов (например, OperandDigestSet)
+        if multisets:
+            import halstead_incremental
+            self._collection = halstead_incremental.Multiset
+        else:
+            self._collection = set
+        self._operand_collection = operand_collection or self._collection
+        self.operators = self._collection()
+        self.operands = self._operand_collection()
+        self.N1 = 0  # Total operators count
+        self.N2 = 0  # Total operands count
+        # При scopes=True за тот же проход собираются метрики каждой функции/класса/lambda.
+        # Счётчики области включают вложенные области; итог модуля не меняется.
+        self._track_scopes = scopes
+        self._scope_stack = [] # (узел, вид, qualname, множества и счётчики внешней области)
+        self.scopes = []
+        # Обработчики узлов, которым недостаточно одного фиксированного оператора.
+        # Обработчик возвращает узел, чьих потомков нужно обойти (обычно сам node),
+        # или None для листьев.
+        self._handlers = {
+            ast.Name: self._walk_Name,
+            ast.Constant: self._walk_Constant,
+            ast.BinOp: self._walk_BinOp,
+            ast.UnaryOp: self._walk_UnaryOp,
+            ast.Compare: self._walk_Compare,
+            ast.BoolOp: self._walk_BoolOp,
+            ast.AugAssign: self._walk_AugAssign,
+            ast.Attribute: self._walk_Attribute,
+            ast.Tuple: self._walk_Tuple,
+            ast.Dict: self._walk_Dict,
+            ast.IfExp: self._walk_IfExp,
+        }
+
+    def _add_operand(self, name_str):
+        # Не добавляем ключевые слова-операторы в операнды
+        if name_str not in PYTHON_KEYWORD_OPERATORS:
+            self.operands.add(name_str)
+            self.N2 += 1
+
+    def _walk_Name(self, node):
+        if node.id not in PYTHON_KEYWORD_OPERATORS and node.id not in ('True', 'False', 'None'):
+            self._add_operand(node.id)
+        return None
+
+    def _walk_Constant(self, node):
+        self._add_operand(str(node.value))
+        return None
+
+    def _walk_BinOp(self, node):
+        op = type(node.op)
+        self.operators.add(HalsteadMetricsVisitor._bin_op_map.get(op, op.__name__))
+        self.N1 += 1
+        return node
+
+    def _walk_UnaryOp(self, node):
+        op = type(node.op)
+        self.operators.add('not' if op is ast.Not else HalsteadMetricsVisitor._unary_op_map.get(op, op.__name__))
+        self.N1 += 1
+        return node
+
+    def _walk_Compare(self, node):
+        for op_node in node.ops:
+            op = type(op_node)
+            self.operators.add(HalsteadMetricsVisitor._compare_op_map.get(op, op.__name__))
+        self.N1 += len(node.ops)
+        return node
+
+    def _walk_BoolOp(self, node):
+        op = type(node.op)
+        self.operators.add(HalsteadMetricsVisitor._bool_op_map.get(op, op.__name__))
+        self.N1 += 1
+        return node
+
+    def _walk_AugAssign(self, node):
+        op = type(node.op)
+        self.operators.add(HalsteadMetricsVisitor._aug_assign_map.get(op, op.__name__ + '='))
+        self.N1 += 1
+        return node
+
+    def _walk_Attribute(self, node):
+        self.operators.add('.')
+        self.N1 += 1
+        self._add_operand(node.attr)
+        # Как и в HalsteadMetricsVisitor.visit_Attribute: обходятся потомки node.value, а не он сам
+        return node.value
+
+    def _walk_Tuple(self, node):
+        self.operators.add('tuple_literal()')
+        self.N1 += 1
+        if len(node.elts) > 1:
+            self.operators.add(',')
+            self.N1 += len(node.elts) - 1 # По одной запятой между элементами
+        return node
+
+    def _walk_Dict(self, node):
+        self.operators.add('dict_literal{}')
+        self.N1 += 1
+        if node.keys:
+            self.operators.add(':')
+            self.N1 += len(node.keys) # По одному двоеточию на пару ключ-значение
+        return node
+
+    def _walk_IfExp(self, node):
+        self.operators.add('if_expr')
+        self.operators.add('else_expr')
+        self.N1 += 2
+        return node
+
+    def _enter_scope(self, node, kind):
+        name = '<lambda>' if kind == 'lambda' else node.name
+        if self._scope_stack:
+            _, parent_kind, parent_qualname, *_ = self._scope_stack[-1]
+            # Как у __qualname__: для вложенных в функцию имён добавляется '<locals>'
+            separator = '.' if parent_kind == 'class' else '.<locals>.'
+            qualname = parent_qualname + separator + name
+        else:
+            qualname = name
+        self._scope_stack.append((node, kind, qualname, self.operators, self.operands, self.N1, self.N2))
+        self.operators = self._collection()
+        self.operands = self._operand_collection()
+        self.N1 = 0
+        self.N2 = 0
+
+    def _exit_scope(self):
+        node, kind, qualname, operators, operands, N1, N2 = self._scope_stack.pop()
+        self.scopes.append({
+            "qualname": qualname,
+            "kind": kind,
+            "lineno": node.lineno,
+            "end_lineno": node.end_lineno,
+            "col_offset": node.col_offset,
+            "operators": sorted(self.operators),
+            "operands": sorted(self.operands),
+            "N1": self.N1,
+            "N2": self.N2,
+        })
+        # Вливаем область во внешнюю, чтобы итоги модуля остались прежними
+        operators.update(self.operators)
+        operands.update(self.operands)
+        self.operators = operators
+        self.operands = operands
+        self.N1 += N1
+        self.N2 += N2
+
+    def walk(self, tree):
+        simple = _SIMPLE_OPERATOR_NODES
+        handlers = self._handlers
+        operators = self.operators
+        child_fields_cache = _child_fields_cache
+        scope_nodes = _SCOPE_NODES if self._track_scopes else {}
+        AST = ast.AST
+        stack = [tree]
+        pop = stack.pop
+        push = stack.append
+        simple_count = 0 # Копим локально, чтобы не обращаться к self.N1 на каждом узле
+
+        while stack:
+            node = pop()
+            if node is _EXIT_SCOPE:
+                self.N1 += simple_count
+                simple_count = 0
+                self._exit_scope()
+                operators = self.operators
+                continue
+
+            cls = node.__class__
+            if scope_nodes:
+                kind = scope_nodes.get(cls)
+                if kind is not None:
+                    self.N1 += simple_count
+                    simple_count = 0
+                    self._enter_scope(node, kind)
+                    operators = self.operators
+                    push(_EXIT_SCOPE) # Снимется со стека после всех потомков node
+
+            label = simple.get(cls)
+            if label is not None:
+                operators.add(label)
+                simple_count += 1
+                expand = node
+            else:
+                handler = handlers.get(cls)
+                if handler is not None:
+                    expand = handler(node)
+                    if expand is None:
+                        continue
+                    cls = expand.__class__
+                else:
+                    expand = node
+
+            fields = child_fields_cache.get(cls)
+            if fields is None:
+                fields = _child_fields(cls)
+            for field in fields:
+                value = getattr(expand, field, None)
+                if isinstance(value, list):
+                    for item in value:
+                        if isinstance(item, AST):
+                            push(item)
+                elif isinstance(value, AST):
+                    push(value)
+
+        self.N1 += simple_count
+        # Порядок записей - порядок областей в исходном тексте
+        self.scopes.sort(key=lambda scope: (scope["lineno"], scope["col_offset"]))
+
+
+# --- Однопроходный анализ по токенам ---
+# Один проход tokenize даёт точные метрики строк (с учётом docstring, многострочных строк
+# и комментариев в конце строки) и, при движке 'tokens', приближённые метрики Холстеда
+# без построения AST - для огромных файлов, где дерево не помещается в память.
+
+_ROW_CODE, _ROW_DOCSTRING, _ROW_COMMENT = 1, 2, 4 # Флаги физической строки
+
+# Типы токенов берутся из лёгкого модуля token; сам tokenize импортируется только в scan
+_NON_CODE_TOKENS = frozenset((token.COMMENT, token.NL, token.NEWLINE, token.INDENT,
+                              token.DEDENT, token.ENCODING, token.ENDMARKER))
+_OPERAND_TOKENS = frozenset((token.NUMBER, token.STRING, getattr(token, 'FSTRING_MIDDLE', -1)))
+_OPENING_BRACKETS = {'(': '()', '[': '[]', '{': '{}'}
+_CLOSING_BRACKETS = frozenset((')', ']', '}')) # Скобка считается один раз, по открывающей
+
+
+class TokenScanner:
+    def __init__(self, halstead=True):
+        self.operators = set()
+        self.operands = set()
+        self.N1 = 0  # Total operators count
+        self.N2 = 0  # Total operands count
+        self.total_lines = 0
+        self._halstead = halstead
+        self._row_flags = bytearray() # По байту флагов на строку, индекс - номер строки
+
+    def _mark_rows(self, first_row, last_row, flag):
+        flags = self._row_flags
+        if len(flags) <= last_row:
+            flags.extend(bytes(last_row + 1 - len(flags)))
+        for row in range(first_row, last_row + 1):
+            flags[row] |= flag
+
+    def _count_token(self, tok_type, text):
+        if tok_type == token.NAME:
+            # Ключевые слова - операторы; True/False/None и идентификаторы - операнды
+            if text in PYTHON_KEYWORD_OPERATORS:
+                self.operators.add(text)
+                self.N1 += 1
+            else:
+                self.operands.add(text)
+                self.N2 += 1
+        elif tok_type == token.OP:
+            if text not in _CLOSING_BRACKETS:
+                self.operators.add(_OPENING_BRACKETS.get(text, text))
+                self.N1 += 1
+        elif tok_type in _OPERAND_TOKENS:
+            self.operands.add(text)
+            self.N2 += 1
+
+    def scan(self, code_string):
+        import tokenize
+        stream = io.StringIO(code_string, newline=None)
+
+        def readline():
+            line = stream.readline()
+            if line:
+                self.total_lines += 1
+            return line
+
+        # Строку-выражение из одних строковых литералов (docstring или "комментарий"
+        # в тройных кавычках) можно отличить от кода только по всей логической строке.
+        logical_spans = []
+        only_strings = True
+        try:
+            for tok_type, text, start, end, _ in tokenize.generate_tokens(readline):
+                if tok_type == token.COMMENT:
+                    self._mark_rows(start[0], start[0], _ROW_COMMENT)
+                elif tok_type == token.NEWLINE or tok_type == token.ENDMARKER:
+                    flag = _ROW_DOCSTRING if only_strings else _ROW_CODE
+                    for first_row, last_row in logical_spans:
+                        self._mark_rows(first_row, last_row, flag)
+                    logical_spans = []
+                    only_strings = True
+                elif tok_type not in _NON_CODE_TOKENS:
+                    logical_spans.append((start[0], end[0]))
+                    if tok_type != token.STRING:
+                        only_strings = False
+                    if self._halstead:
+                        self._count_token(tok_type, text)
+        except tokenize.TokenError as e:
+            # Например, незакрытая скобка в конце файла: сообщаем так же, как ast.parse
+            message, (lineno, offset) = e.args
+            raise SyntaxError(message, ("<string>", lineno, offset, None)) from None
+
+    def line_metrics(self):
+        code = docstring = comment = blank = inline_comment = 0
+        flags = self._row_flags
+        for row in range(1, self.total_lines + 1):
+            flag = flags[row] if row < len(flags) else 0
+            if flag & _ROW_CODE:
+                code += 1
+                if flag & _ROW_COMMENT:
+                    inline_comment += 1 # Код с комментарием в конце строки
+            elif flag & _ROW_DOCSTRING:
+                docstring += 1
+            elif flag & _ROW_COMMENT:
+                comment += 1
+            else:
+                blank += 1
+        return {
+            "total": self.total_lines,
+            "code": code,
+            "comment": comment,
+            "blank": blank,
+            "docstring": docstring,
+            "inline_comment": inline_comment,
+        }
+
+
+def _strip_bom(code_string):
+    # Убираем BOM, если он есть (часто проблема при чтении файлов из Windows)
+    if code_string.startswith('\ufeff'):
+        return code_string[1:]
+    return code_string
+
+
+# Движки подсчёта: 'table' - основной, 'visitor' - исходный рекурсивный, эталон для сверки,
+# 'tokens' - приближённый подсчёт по токенам без построения AST
+ENGINES = ('table', 'visitor', 'tokens')
+_engine = 'table'
+_collect_lines = False # Добавлять ли метрики строк (см. TokenScanner.line_metrics)
+_collect_scopes = False # Добавлять ли метрики функций и классов (только движок 'table')
+_collect_minhash = False # Добавлять ли сигнатуру MinHash для индекса похожих файлов
+_operand_digests = None # None - операнды как есть, иначе длина превью при хранении операндов дайджестами
+_collect_stats = False # Добавлять ли в запись статистику выполнения (см. halstead_stats)
+
+# Глубоко вложенный код (длинные цепочки BinOp и т.п.) вызывает RecursionError уже
+# при построении AST. Такой код разбираем повторно в отдельном потоке с большим стеком.
+DEEP_PARSE_STACK_SIZE = 256 * 1024 * 1024
+DEEP_PARSE_RECURSION_LIMIT = 200000
+
+
+def select_engine(name):
+    global _engine
+    if name not in ENGINES:
+        raise ValueError(f"Unknown engine '{name}', expected one of: {', '.join(ENGINES)}")
+    _engine = name
+
+
+def set_line_metrics(enabled):
+    global _collect_lines
+    _collect_lines = bool(enabled)
+
+
+def set_scope_metrics(enabled):
+    global _collect_scopes
+    _collect_scopes = bool(enabled)
+
+
+def set_minhash(enabled):
+    global _collect_minhash
+    _collect_minhash = bool(enabled)
+
+
+def set_stats(enabled):
+    global _collect_stats
+    _collect_stats = bool(enabled)
+
+
+def set_operand_digests(preview_length):
+    # None отключает режим; 0 - только дайджест, N > 0 - дайджест и первые N символов операнда
+    global _operand_digests
+    if preview_length is not None and preview_length < 0:
+        raise ValueError("Operand preview length must be non-negative")
+    _operand_digests = preview_length
+
+
+OPERAND_DIGEST_SIZE = 8 # Байт BLAKE2b; 16 hex-символов на операнд независимо от его длины
+
+
+class OperandDigestSet(set):
+    # Вместо текста операнда хранит его дайджест фиксированного размера: многомегабайтные
+    # литералы не копируются в результат, а запятые и переводы строк не портят вывод.
+    # Одинаковые операнды дают одинаковый элемент, поэтому n2 не меняется.
+    def __init__(self, preview_length=0):
+        import hashlib
+        super().__init__()
+        self._preview_length = preview_length
+        self._blake2b = hashlib.blake2b
+
+    def add(self, item):
+        digest = self._blake2b(item.encode('utf-8', 'surrogatepass'),
+                               digest_size=OPERAND_DIGEST_SIZE).hexdigest()
+        if self._preview_length:
+            # Превью однозначно определяется операндом; разделители заменяем, чтобы
+            # строку operands: по-прежнему можно было делить по запятым
+            preview = ''.join(ch if ch.isprintable() and ch != ',' else '?'
+                              for ch in item[:self._preview_length])
+            digest = f"{digest}:{preview}"
+        set.add(self, digest)
+
+
+def _parse_deep(code_string):
+    import threading
+    result = {}
+
+    def parse_in_thread():
+        try:
+            result['tree'] = ast.parse(code_string)
+        except BaseException as e:
+            result['error'] = e
+
+    old_limit = sys.getrecursionlimit()
+    old_stack_size = threading.stack_size()
+    try:
+        threading.stack_size(DEEP_PARSE_STACK_SIZE)
+        sys.setrecursionlimit(max(old_limit, DEEP_PARSE_RECURSION_LIMIT))
+        thread = threading.Thread(target=parse_in_thread)
+        thread.start()
+        thread.join()
+    finally:
+        threading.stack_size(old_stack_size)
+        sys.setrecursionlimit(old_limit)
+
+    if 'error' in result:
+        raise result['error']
+    return result['tree']
+
+
+def parse_source(code_string):
+    try:
+        return ast.parse(code_string)
+    except RecursionError:
+        return _parse_deep(code_string)
+
+
+def compute_analysis(code_string, engine=None, with_lines=False, with_scopes=False, with_minhash=False,
+                     operand_digests=None, stats=None):
+    # Возвращает словарь: operators и operands (множества), N1, N2, а также
+    # lines, scopes и minhash, если они запрошены (operand_digests - см. set_operand_digests).
+    # Если передан словарь stats, в него добавляются время фаз, число узлов AST по типам
+    # и время обработчиков узлов (см. halstead_stats).
+    # Ошибки парсинга не пишутся в stderr, а пробрасываются наружу: вызывающий код
+    # сам решает, как их сообщить.
+    clock = time.perf_counter
+    start = clock()
+    code_string = _strip_bom(code_string)
+    _add_phase(stats, "read_s", clock() - start)
+    engine = engine or _engine
+    if with_scopes and engine != 'table':
+        raise ValueError("Per-scope metrics are only supported by the 'table' engine")
+    if with_minhash and operand_digests is not None:
+        raise ValueError("MinHash signatures are computed from full operands, not digests")
+    stream = [] if with_minhash else None
+    operand_collection = None
+    if operand_digests is not None:
+        operand_collection = lambda: OperandDigestSet(operand_digests)
+    profiler = None
+    if stats is not None:
+        import halstead_stats # Только с --stats
+        profiler = halstead_stats.HandlerProfiler()
+
+    if engine == 'tokens':
+        walker = scanner = TokenScanner(halstead=True)
+        _prepare_walker(walker, stream, operand_collection)
+        start = clock()
+        scanner.scan(code_string)
+        _add_phase(stats, "walk_s", clock() - start)
+    else:
+        start = clock()
+        tree = parse_source(code_string)
+        _add_phase(stats, "parse_s", clock() - start)
+        if engine == 'visitor':
+            walker = HalsteadMetricsVisitor()
+            _prepare_walker(walker, stream, operand_collection)
+            if profiler is not None:
+                profiler.instrument_visitor(walker)
+            start = clock()
+            walker.visit(tree)
+        else:
+            walker = TableHalsteadWalker(scopes=with_scopes, operand_collection=operand_collection)
+            _prepare_walker(walker, stream)
+            if profiler is not None:
+                profiler.instrument_table_walker(walker)
+            start = clock()
+            walker.walk(tree)
+        _add_phase(stats, "walk_s", clock() - start)
+        if stats is not None:
+            stats["nodes"] = halstead_stats.count_nodes(tree)
+            stats["handlers"] = profiler.report()
+        del tree # Освобождаем дерево до прохода tokenize
+        scanner = None
+
+    analysis = {"operators": walker.operators, "operands": walker.operands, "N1": walker.N1, "N2": walker.N2}
+    if with_lines:
+        start = clock()
+        if scanner is None:
+            scanner = TokenScanner(halstead=False)
+            scanner.scan(code_string)
+        analysis["lines"] = scanner.line_metrics()
+        _add_phase(stats, "lines_s", clock() - start)
+    if with_scopes:
+        analysis["scopes"] = walker.scopes
+    if with_minhash:
+        import halstead_index
+        start = clock()
+        analysis["minhash"] = halstead_index.minhash_signature(stream)
+        _add_phase(stats, "minhash_s", clock() - start)
+    return analysis
+
+
+def _prepare_walker(walker, stream, operand_collection=None):
+    # Подменяем множества обходчика: RecordingSet запоминает операторы и операнды
+    # в порядке обхода, operand_collection задаёт другое множество операндов
+    if stream is not None:
+        import halstead_index
+        walker.operators = halstead_index.RecordingSet(stream, 'o:')
+        walker.operands = halstead_index.RecordingSet(stream, 'a:')
+    if operand_collection is not None:
+        walker.operands = operand_collection()
+
+
+def _analyze_chunk(code_string):
+    # Частичный результат для одного фрагмента файла в инкрементальном режиме
+    walker = TableHalsteadWalker(multisets=True)
+    walker.walk(parse_source(code_string))
+    return walker.operators, walker.operands, walker.N1, walker.N2
+
+
+# Состояние инкрементального анализа по файлам (создаётся при первом запросе)
+_incremental_analyzer = None
+
+
+def compute_incremental_analysis(key, code_string):
+    # Повторный анализ того же key обходит только изменившиеся инструкции верхнего уровня.
+    # Результат совпадает с compute_analysis для движка 'table' (без lines и scopes).
+    global _incremental_analyzer
+    if _incremental_analyzer is None:
+        import halstead_incremental
+        _incremental_analyzer = halstead_incremental.IncrementalAnalyzer(_analyze_chunk)
+    operators, operands, N1, N2, chunks, reanalyzed = \
+        _incremental_analyzer.analyze(key, _strip_bom(code_string))
+    return {"operators": operators, "operands": operands, "N1": N1, "N2": N2,
+            "incremental": {"chunks": chunks, "reanalyzed": reanalyzed}}
+
+
+def compute_halstead_metrics(code_string, engine=None):
+    analysis = compute_analysis(code_string, engine)
+    return analysis["operators"], analysis["operands"], analysis["N1"], analysis["N2"]
+
+
+# Кэш результатов текущего процесса (None - кэш отключён, см. activate_cache)
+_result_cache = None
+
+
+def activate_cache(path, max_bytes=None):
+    # Вызывать после select_engine/set_line_metrics/set_scope_metrics: от них зависит содержимое записей.
+    # max_bytes=None - halstead_cache.DEFAULT_MAX_BYTES
+    global _result_cache
+    import halstead_cache # sqlite3 и hashlib нужны только с кэшем
+    if max_bytes is None:
+        max_bytes = halstead_cache.DEFAULT_MAX_BYTES
+    family = 'tokens' if _engine == 'tokens' else 'ast' # 'table' и 'visitor' дают одинаковый результат
+    if _collect_lines:
+        family += '+lines'
+    if _collect_scopes:
+        family += '+scopes'
+    if _collect_minhash:
+        family += f'+minhash-{_engine}' # Порядок обхода у движков разный, а с ним и сигнатура
+    if _operand_digests is not None:
+        family += f'+digest{_operand_digests}'
+    namespace = (f"parse_python/{ENGINE_VERSION}/format-{CACHE_FORMAT_VERSION}/{family}/"
+                 f"python-{halstead_cache.python_version_tag()}")
+    _result_cache = halstead_cache.open_cache(path, namespace, max_bytes)
+    return _result_cache
+
+
+def cached_analysis(code_string, stats=None):
+    cache = _result_cache
+    if cache is None:
+        return compute_analysis(code_string, with_lines=_collect_lines, with_scopes=_collect_scopes,
+                                with_minhash=_collect_minhash, operand_digests=_operand_digests, stats=stats)
+
+    import sqlite3 # Уже загружен вместе с кэшем
+    start = time.perf_counter()
+    key = cache.make_key(_strip_bom(code_string).encode('utf-8', 'surrogatepass'))
+    try:
+        cached = cache.get(key)
+    except sqlite3.Error: # Например, база заблокирована слишком долго
+        cached = None
+    except ValueError: # Повреждённая запись: считаем промахом, ниже она будет перезаписана
+        cached = None
+    if cached is not None and not _is_cached_analysis(cached):
+        cached = None # Запись другого формата (например, от старой версии скрипта)
+    _add_phase(stats, "cache_s", time.perf_counter() - start)
+    if stats is not None:
+        stats["cache"] = "miss" if cached is None else "hit"
+    if cached is not None:
+        cached["operators"] = set(cached["operators"])
+        cached["operands"] = set(cached["operands"])
+        return cached
+
+    # Ошибки парсинга не кэшируются
+    analysis = compute_analysis(code_string, with_lines=_collect_lines, with_scopes=_collect_scopes,
+                                with_minhash=_collect_minhash, operand_digests=_operand_digests, stats=stats)
+    try:
+        cache.put(key, {**analysis,
+                        "operators": sorted(analysis["operators"]),
+                        "operands": sorted(analysis["operands"])})
+    except sqlite3.Error:
+        pass
+    return analysis
+
+
+def _is_cached_analysis(value):
+    # Проверяем структуру записи кэша: от неё зависит, сможем ли мы собрать результат
+    if not isinstance(value, dict):
+        return False
+    if not (isinstance(value.get("operators"), list) and isinstance(value.get("operands"), list)
+            and isinstance(value.get("N1"), int) and isinstance(value.get("N2"), int)):
+        return False
+    required = {"lines": _collect_lines, "scopes": _collect_scopes, "minhash": _collect_minhash}
+    return all(name in value for name, enabled in required.items() if enabled)
+
+
+def cached_halstead_metrics(code_string):
+    analysis = cached_analysis(code_string)
+    return analysis["operators"], analysis["operands"], analysis["N1"], analysis["N2"]
+
+
+def _report_analysis_error(e):
+    if isinstance(e, SyntaxError):
+        # Формируем более информативное сообщение об ошибке
+        error_line = e.text.strip() if e.text else "N/A"
+        sys.stderr.write(f"Python AST Parser SyntaxError: {e.msg}\n")
+        sys.stderr.write(f"  File \"<string>\", line {e.lineno}, offset {e.offset}\n")
+        sys.stderr.write(f"    {error_line}\n")
+        if e.offset is not None:
+             sys.stderr.write(f"    {' ' * e.offset}^\n")
+    else: # Другие возможные ошибки при парсинге
+        sys.stderr.write(f"Python AST Parser Error: {type(e).__name__} - {e}\n")
+
+
+def get_halstead_metrics_from_ast(code_string):
+    try:
+        return cached_halstead_metrics(code_string)
+    except Exception as e:
+        _report_analysis_error(e)
+        return None, None, 0, 0
+
+
+def read_source_file(file_path, stats=None):
+    # Читаем файл, явно указывая UTF-8, чтобы избежать проблем с кодировкой по умолчанию
+    start = time.perf_counter()
+    with open(file_path, 'r', encoding='utf-8') as f:
+        source_code = f.read()
+    _add_phase(stats, "read_s", time.perf_counter() - start)
+    return source_code
+
+
+# --- Структурированные записи результатов (JSON) ---
+def make_result_record(analysis):
+    # Сортируем для консистентности вывода (полезно для тестов и сравнения)
+    record = {
+        "ok": True,
+        "operators": sorted(analysis["operators"]),
+        "operands": sorted(analysis["operands"]),
+        "N1": analysis["N1"],
+        "N2": analysis["N2"],
+    }
+    for optional in ("lines", "scopes", "incremental", "minhash"):
+        if optional in analysis:
+            record[optional] = analysis[optional]
+    return record
+
+
+def make_error_record(exc):
+    record = {"ok": False, "error": type(exc).__name__, "message": str(exc)}
+    if isinstance(exc, SyntaxError):
+        record["message"] = exc.msg
+        record["lineno"] = exc.lineno
+        record["offset"] = exc.offset
+    return record
+
+
+def analyze_to_record(code_string, stats=None):
+    try:
+        analysis = cached_analysis(code_string, stats)
+        start = time.perf_counter()
+        record = make_result_record(analysis)
+        _add_phase(stats, "serialize_s", time.perf_counter() - start)
+    except Exception as e: # SyntaxError, ValueError (нулевые байты), RecursionError и т.п.
+        record = make_error_record(e)
+    return _attach_stats(record, stats)
+
+
+def _add_phase(stats, name, seconds):
+    # Без --stats halstead_stats не импортируется
+    if stats is not None:
+        import halstead_stats
+        halstead_stats.add_phase(stats, name, seconds)
+
+
+def _attach_stats(record, stats):
+    if stats is not None:
+        import halstead_stats
+        stats["peak_rss_bytes"] = halstead_stats.peak_rss_bytes()
+        record["stats"] = stats
+    return record
+
+
+def _new_stats():
+    if not _collect_stats:
+        return None
+    import halstead_stats
+    return halstead_stats.new_stats()
+
+
+# Форматы вывода записей: 'json' - одна строка JSON на запись (NDJSON),
+# 'framed' - длина записи (4 байта, little-endian) и JSON в ASCII без перевода строки.
+# 'text' - прежний построчный вывод operators:/operands:, только для одного файла.
+OUTPUT_FORMATS = ('text', 'json', 'framed')
+_output_format = 'json'
+FRAME_HEADER_SIZE = 4
+
+
+def set_output_format(name):
+    global _output_format
+    if name not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format '{name}', expected one of: {', '.join(OUTPUT_FORMATS)}")
+    _output_format = name
+
+
+def write_record(output_stream, record):
+    # Каждая запись сразу отправляется потребителю
+    stats = record.pop("stats", None)
+    start = time.perf_counter()
+    payload = json.dumps(record)
+    if stats is not None:
+        # Время сериализации самой записи попадает в её статистику, поэтому stats дописываются последними
+        _add_phase(stats, "serialize_s", time.perf_counter() - start)
+        payload = payload[:-1] + ', "stats": ' + json.dumps(stats) + '}'
+        record["stats"] = stats
+    if _output_format != 'framed':
+        output_stream.write(payload + "\n")
+        output_stream.flush()
+        return
+    data = payload.encode('ascii') # json.dumps экранирует всё, что вне ASCII
+    output_stream.flush()
+    buffer = getattr(output_stream, 'buffer', output_stream)
+    buffer.write(len(data).to_bytes(FRAME_HEADER_SIZE, 'little') + data)
+    buffer.flush()
+
+
+def _configure_utf8_stdio():
+    # На Windows кодировка консоли по умолчанию не UTF-8, а C# читает потоки как UTF-8
+    for stream in (sys.stdin, sys.stdout):
+        if hasattr(stream, 'reconfigure'):
+            stream.reconfigure(encoding='utf-8')
+
+
+# --- Режим сервера: один процесс обслуживает много запросов ---
+def handle_serve_request(line, incremental=False):
+    # Запрос - одна строка JSON: {"id": ..., "source": "<код>"} или {"id": ..., "path": "<файл>"}.
+    # "incremental": true (или --incremental) - пересчитывать только изменённые инструкции;
+    # состояние хранится по "key", по умолчанию - по "path".
+    try:
+        request = json.loads(line)
+    except ValueError as e:
+        return {"id": None, "ok": False, "error": "BadRequest", "message": f"Invalid JSON: {e}"}
+    if not isinstance(request, dict):
+        return {"id": None, "ok": False, "error": "BadRequest", "message": "Request must be a JSON object"}
+
+    request_id = request.get("id")
+    # Только строки: целый "path" open() принял бы за дескриптор файла и закрыл бы stdin/stdout
+    for field in ("source", "path", "key"):
+        if field in request and not isinstance(request[field], str):
+            return {"id": request_id, "ok": False, "error": "BadRequest",
+                    "message": f"'{field}' must be a string"}
+
+    stats = _new_stats()
+    if "source" in request:
+        source_code = request["source"]
+    elif "path" in request:
+        try:
+            source_code = read_source_file(request["path"], stats)
+        except Exception as e: # FileNotFoundError, UnicodeDecodeError, PermissionError
+            return {"id": request_id, **make_error_record(e)}
+    else:
+        return {"id": request_id, "ok": False, "error": "BadRequest",
+                "message": "Request must contain 'source' or 'path'"}
+
+    if not request.get("incremental", incremental):
+        return {"id": request_id, **analyze_to_record(source_code, stats)}
+
+    key = request.get("key", request.get("path"))
+    if key is None:
+        return {"id": request_id, "ok": False, "error": "BadRequest",
+                "message": "Incremental request with 'source' must contain 'key'"}
+    if _engine != 'table' or _collect_lines or _collect_scopes or _operand_digests is not None:
+        return {"id": request_id, "ok": False, "error": "BadRequest",
+                "message": "Incremental analysis supports only the 'table' engine "
+                           "without --lines/--scopes/--digest-operands"}
+    try:
+        start = time.perf_counter()
+        analysis = compute_incremental_analysis(key, source_code)
+        _add_phase(stats, "incremental_s", time.perf_counter() - start)
+        record = make_result_record(analysis)
+    except Exception as e:
+        record = make_error_record(e)
+    return {"id": request_id, **_attach_stats(record, stats)}
+
+
+def serve(input_stream, output_stream, incremental=False):
+    # Читаем построчно через readline, а не итерацией по потоку,
+    # чтобы не ждать заполнения буфера при интерактивной работе через pipe.
+    while True:
+        line = input_stream.readline()
+        if not line:
+            break # EOF - клиент закрыл stdin
+        if not line.strip():
+            continue
+        write_record(output_stream, handle_serve_request(line, incremental))
+
+
+# --- Пакетный режим: много файлов, каталоги, маски, архивы ---
+# Какие элементы архивов анализировать (маска fnmatch по имени внутри архива)
+_archive_member_pattern = None # None - halstead_archive.DEFAULT_MEMBER_PATTERN
+
+# Сколько заданий на процесс пула может ждать обработки или выдачи результата.
+# Для элементов архивов задание - уже декодированный текст, поэтому очередь ограничена.
+PENDING_ITEMS_PER_JOB = 32
+# По одному заданию за раз: запись готового файла не ждёт остальных файлов своей порции
+BATCH_CHUNK_SIZE = 1
+
+
+def set_archive_member_pattern(pattern):
+    global _archive_member_pattern
+    _archive_member_pattern = pattern
+
+
+def iter_source_paths(inputs):
+    # Разворачиваем аргументы лениво, чтобы первые результаты появлялись
+    # ещё до окончания обхода большого дерева каталогов.
+    # Архивы (.zip, .tar.gz и т.п.) дают задания (путь элемента, текст или исключение).
+    for item in inputs:
+        if os.path.isdir(item):
+            for root, dirs, files in os.walk(item):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.endswith('.py'):
+                        yield os.path.join(root, name)
+        elif glob.has_magic(item):
+            for path in sorted(glob.iglob(item, recursive=True)):
+                if os.path.isfile(path):
+                    yield from _expand_file(path)
+        else:
+            yield from _expand_file(item) # Несуществующий файл даст запись об ошибке, а не исключение
+
+
+def _expand_file(path):
+    import halstead_archive # tarfile/zipfile нужны только пакетным режимам, не запуску на один файл
+    if halstead_archive.is_archive(path) and os.path.isfile(path):
+        return halstead_archive.iter_archive_sources(
+            path, _archive_member_pattern or halstead_archive.DEFAULT_MEMBER_PATTERN)
+    return (path,)
+
+
+def analyze_path_to_record(file_path):
+    # Вызывается в процессах пула: любая ошибка превращается в запись, а не роняет пакет
+    stats = _new_stats()
+    try:
+        source_code = read_source_file(file_path, stats)
+    except Exception as e:
+        return {"path": file_path, **make_error_record(e)}
+    return {"path": file_path, **analyze_to_record(source_code, stats)}
+
+
+def analyze_item_to_record(item):
+    # Задание пакета: путь к файлу или (путь элемента архива, текст либо ошибка чтения)
+    if isinstance(item, str):
+        return analyze_path_to_record(item)
+    path, source_code = item
+    if isinstance(source_code, Exception):
+        return {"path": path, **make_error_record(source_code)}
+    return {"path": path, **analyze_to_record(source_code, _new_stats())}
+
+
+def _current_settings():
+    # Настройки анализа, которые нужно передать в процессы пула
+    return {"engine": _engine, "lines": _collect_lines, "scopes": _collect_scopes,
+            "minhash": _collect_minhash, "operand_digests": _operand_digests, "stats": _collect_stats}
+
+
+def _apply_settings(settings):
+    select_engine(settings["engine"])
+    set_line_metrics(settings["lines"])
+    set_scope_metrics(settings["scopes"])
+    set_minhash(settings["minhash"])
+    set_operand_digests(settings["operand_digests"])
+    set_stats(settings["stats"])
+
+
+def _init_batch_worker(cache_path, cache_max_bytes, settings):
+    _apply_settings(settings)
+    # Каждый процесс пула открывает собственное соединение с кэшем
+    if cache_path is not None:
+        activate_cache(cache_path, cache_max_bytes)
+
+
+def _init_pool_worker(cache_path, cache_max_bytes, settings):
+    _init_batch_worker(cache_path, cache_max_bytes, settings)
+    if _result_cache is not None:
+        # Процессы пула не вызывают atexit; Finalize срабатывает при их штатном завершении
+        # (pool.close/join) и сбрасывает накопленные счётчики кэша
+        import multiprocessing.util
+        multiprocessing.util.Finalize(None, _result_cache.close, exitpriority=10)
+
+
+def iter_batch_records(inputs, jobs=None, cache_path=None,
+                       cache_max_bytes=None, ordered=False):
+    paths = iter_source_paths(inputs)
+
+    if jobs == 1:
+        _init_batch_worker(cache_path, cache_max_bytes, _current_settings())
+        yield from map(analyze_item_to_record, paths)
+        return
+
+    # imap сам забирает задания из итератора без ограничений, поэтому выдаём их
+    # через семафор: новое задание - только после выдачи результата одного из прежних
+    import threading
+    pending = threading.Semaphore(PENDING_ITEMS_PER_JOB * (jobs or os.cpu_count() or 1))
+    stopped = threading.Event()
+
+    def throttled(items):
+        for item in items:
+            while not pending.acquire(timeout=0.1):
+                if stopped.is_set(): # Потребитель прекратил чтение, пул закрывается
+                    return
+            yield item
+
+    import multiprocessing # Заметно удлиняет запуск, поэтому только для пула
+    with multiprocessing.Pool(processes=jobs, initializer=_init_pool_worker,
+                              initargs=(cache_path, cache_max_bytes, _current_settings())) as pool:
+        # imap_unordered отдаёт результаты по мере готовности, а не в порядке путей
+        imap = pool.imap if ordered else pool.imap_unordered
+        try:
+            for record in imap(analyze_item_to_record, throttled(paths), chunksize=BATCH_CHUNK_SIZE):
+                pending.release()
+                yield record
+        finally:
+            stopped.set()
+        # Штатное завершение процессов пула (а не terminate при выходе из with)
+        pool.close()
+        pool.join()
+
+
+def run_batch(inputs, output_stream, jobs=None, cache_path=None,
+              cache_max_bytes=None):
+    failed = 0
+    for record in iter_batch_records(inputs, jobs, cache_path, cache_max_bytes):
+        failed += not record["ok"]
+        write_record(output_stream, record)
+    return failed
+
+
+# --- Режим матрицы: каждый файл анализируется один раз, схожесть всех пар - одним проходом ---
+def run_matrix(inputs, output_path, output_stream, jobs=None, cache_path=None,
+               cache_max_bytes=None):
+    try:
+        import halstead_matrix # NumPy нужен только этому режиму
+    except ImportError as e:
+        sys.stderr.write(f"--matrix requires NumPy: {e}\n")
+        return 1
+
+    records = list(iter_batch_records(inputs, jobs, cache_path, cache_max_bytes, ordered=True))
+    analyzed = [r for r in records if r["ok"]]
+    # Файлы с ошибками в матрицу не попадают, но перечисляются в итоговой записи
+    failed = [{"path": r["path"], "error": r["error"], "message": r["message"]}
+              for r in records if not r["ok"]]
+
+    metrics = halstead_matrix.metric_vectors(analyzed)
+    matrix = halstead_matrix.similarity_matrix(metrics)
+    halstead_matrix.save_matrix(output_path, [r["path"] for r in analyzed], metrics, matrix)
+
+    write_record(output_stream, {"ok": not failed, "output": output_path,
+                                 "files": len(analyzed), "failed": failed})
+    return 1 if failed else 0
+
+
+# --- Индекс похожих файлов: MinHash/LSH поверх потока операторов и операндов ---
+INDEX_COMMIT_EVERY = 256 # Сколько файлов записывать в индекс одной транзакцией
+
+
+def run_index(inputs, index_path, output_stream, query=False, top_k=10, jobs=None,
+              cache_path=None, cache_max_bytes=None):
+    # Без query файлы добавляются в индекс; с query для каждого файла выводятся
+    # top_k самых похожих уже проиндексированных файлов (сам файл не учитывается)
+    import sqlite3
+    import halstead_index
+    try:
+        index = halstead_index.LSHIndex(index_path, engine=_engine, engine_version=ENGINE_VERSION)
+    except (sqlite3.Error, OSError, ValueError) as e:
+        sys.stderr.write(f"Cannot open index '{index_path}': {type(e).__name__} - {e}\n")
+        return 1
+
+    failed = 0
+    pending = []
+    try:
+        for record in iter_batch_records(inputs, jobs, cache_path, cache_max_bytes):
+            if not record["ok"]:
+                failed += 1
+                write_record(output_stream, record)
+                continue
+            path = os.path.abspath(record["path"])
+            signature = record["minhash"]
+            if query:
+                result = {"path": record["path"], "ok": True,
+                          "matches": index.query(signature, top_k, exclude_path=path)}
+            else:
+                counts = (len(record["operators"]), len(record["operands"]), record["N1"], record["N2"])
+                pending.append((path, signature, counts))
+                if len(pending) >= INDEX_COMMIT_EVERY:
+                    index.add_many(pending)
+                    pending = []
+                result = {"path": record["path"], "ok": True, "indexed": True}
+            write_record(output_stream, result)
+        if pending:
+            index.add_many(pending)
+    finally:
+        index.close()
+    return 1 if failed else 0
+
+
+def run_single_file(file_path):
+    try:
+        stats = _new_stats()
+        source_code = read_source_file(file_path, stats)
+
+        try:
+            analysis = cached_analysis(source_code, stats)
+        except Exception as e:
+            _report_analysis_error(e)
+            sys.exit(1)
+        operators, operands = analysis["operators"], analysis["operands"]
+        start = time.perf_counter()
+
+        # Вывод в формате, который будет парсить C#
+        # Сортируем для консистентности вывода (полезно для тестов и сравнения)
+        print(f"operators:{','.join(sorted(list(operators)))}")
+        print(f"operands:{','.join(sorted(list(operands)))}")
+        print(f"N1:{analysis['N1']}")
+        print(f"N2:{analysis['N2']}")
+        # Дополнительные строки только с --lines/--scopes; C# пропускает незнакомые префиксы
+        for name, value in analysis.get("lines", {}).items():
+            print(f"lines_{name}:{value}")
+        for scope in analysis.get("scopes", ()):
+            print(f"scope:{json.dumps(scope)}")
+        if stats is not None:
+            _add_phase(stats, "serialize_s", time.perf_counter() - start)
+            print(f"stats:{json.dumps(_attach_stats({}, stats)['stats'])}")
+
+    except FileNotFoundError:
+        sys.stderr.write(f"Error: Python script could not find file at '{file_path}'\n")
+        sys.exit(1)
+    except Exception as e: # Другие ошибки, например, проблемы с правами доступа к файлу
+        sys.stderr.write(f"An unexpected error occurred in Python script: {type(e).__name__} - {e}\n")
+        sys.exit(1)
+
+
+def _positive_int(value):
+    try:
+        number = int(value)
+    except ValueError:
+        number = 0
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be a positive integer, got {value}")
+    return number
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(
+        prog="parse_python.py",
+        description="Halstead metrics for Python source code.")
+    parser.add_argument("paths", nargs="*", metavar="file_path",
+                        help="Python file to analyze")
+    parser.add_argument("--serve", action="store_true",
+                        help="long-lived mode: JSON-lines requests on stdin, one JSON result per line on stdout")
+    parser.add_argument("--incremental", action="store_true",
+                        help="with --serve: re-analyze only changed top-level statements of files seen before")
+    parser.add_argument("--batch", action="store_true",
+                        help="analyze many files, directories, glob patterns or archives; one JSON line per file")
+    parser.add_argument("--matrix", metavar="OUTPUT", default=None,
+                        help="analyze files like --batch and write the pairwise similarity matrix "
+                             "to OUTPUT (.npz, otherwise CSV); requires NumPy")
+    parser.add_argument("--archive-members", metavar="GLOB", default=None,
+                        help=".zip/.tar(.gz|.bz2|.xz) inputs are read in memory without extracting; "
+                             "analyze members whose name matches GLOB (default: *.py). "
+                             "Results are tagged as <archive>!<member>")
+    parser.add_argument("--index", metavar="DB", default=None,
+                        help="add files (like --batch) to the MinHash/LSH similarity index DB")
+    parser.add_argument("--query", action="store_true",
+                        help="with --index: print the most similar indexed files for each file instead of adding it")
+    parser.add_argument("--top-k", type=_positive_int, default=10,
+                        help="with --query: number of matches per file (default: %(default)s)")
+    parser.add_argument("-j", "--jobs", type=_positive_int, default=None,
+                        help="worker processes for --batch/--matrix (default: number of CPU cores)")
+    parser.add_argument("--engine", choices=ENGINES, default='table',
+                        help="counting engine; 'visitor' is the recursive reference implementation, "
+                             "'tokens' is an approximate AST-free count for huge files (default: %(default)s)")
+    parser.add_argument("--lines", action="store_true",
+                        help="also report total/code/comment/blank/docstring line counts from a tokenize pass")
+    parser.add_argument("--scopes", action="store_true",
+                        help="also report metrics for every class, function and lambda (table engine only)")
+    parser.add_argument("--digest-operands", action="store_true",
+                        help="report every operand as a fixed-size BLAKE2b digest instead of its text "
+                             "(bounded output for files with huge literals; n2 is unchanged)")
+    parser.add_argument("--operand-preview", type=int, default=0, metavar="N",
+                        help="with --digest-operands: append the first N characters of each operand to its digest")
+    parser.add_argument("--output-format", choices=OUTPUT_FORMATS, default=None,
+                        help="'text' (operators:/operands: lines, single file only), 'json' (one JSON line per record) "
+                             "or 'framed' (4-byte little-endian length + JSON per record); "
+                             "default: text for a single file, json otherwise")
+    parser.add_argument("--stats", action="store_true",
+                        help="add a 'stats' object to every result: phase timings, AST node counts per type, "
+                             "time per node handler, cache hit/miss and peak RSS of the analyzing process")
+    parser.add_argument("--profile", metavar="FILE", default=None,
+                        help="write cProfile statistics of this process to FILE "
+                             "(worker processes are not profiled; use -j 1 with --batch)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="do not read or write the on-disk result cache")
+    parser.add_argument("--cache-path", default=None,
+                        help="result cache file (default: MCode/parse_python_cache.sqlite3 in the per-user cache directory)")
+    parser.add_argument("--cache-max-mb", type=float, default=None,
+                        help="cache size limit in MB; least recently used entries are evicted (default: 256)")
+    parser.add_argument("--cache-stats", action="store_true",
+                        help="print cache statistics as JSON and exit")
+    return parser
+
+
+def main(argv=None):
+    parser = build_arg_parser()
+    args = parser.parse_args(argv)
+    if args.scopes and args.engine != 'table':
+        parser.error("--scopes requires --engine table")
+    if args.incremental and (not args.serve or args.engine != 'table' or args.lines or args.scopes):
+        parser.error("--incremental requires --serve and --engine table, without --lines/--scopes")
+    if args.operand_preview and not args.digest_operands:
+        parser.error("--operand-preview requires --digest-operands")
+    if args.operand_preview < 0:
+        parser.error("--operand-preview must be non-negative")
+    if args.digest_operands and (args.incremental or args.index):
+        parser.error("--digest-operands cannot be combined with --incremental or --index")
+    single_file = not (args.serve or args.batch or args.matrix or args.index)
+    if args.output_format == 'text' and not single_file:
+        parser.error("--output-format text is only available for a single file")
+    if args.query and not args.index:
+        parser.error("--query requires --index")
+    if args.index and (args.lines or args.scopes):
+        parser.error("--index cannot be combined with --lines/--scopes")
+    select_engine(args.engine)
+    set_line_metrics(args.lines)
+    set_scope_metrics(args.scopes)
+    set_minhash(bool(args.index))
+    set_operand_digests(args.operand_preview if args.digest_operands else None)
+    set_output_format(args.output_format or ('text' if single_file else 'json'))
+    set_stats(args.stats)
+    set_archive_member_pattern(args.archive_members)
+
+    cache_path = None
+    cache_max_bytes = None if args.cache_max_mb is None else int(args.cache_max_mb * 1024 * 1024)
+    if not args.no_cache:
+        import halstead_cache
+        cache_path = args.cache_path or halstead_cache.default_cache_path()
+        cache = activate_cache(cache_path, cache_max_bytes)
+        if args.cache_stats:
+            print(json.dumps(cache.stats() if cache is not None else {"path": cache_path, "available": False}))
+            return
+
+    if not args.profile:
+        _run_mode(args, cache_path, cache_max_bytes)
+        return
+    import cProfile # Нужен только с --profile
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        _run_mode(args, cache_path, cache_max_bytes)
+    finally: # В том числе при sys.exit
+        profiler.disable()
+        profiler.dump_stats(args.profile)
+
+
+def _run_mode(args, cache_path, cache_max_bytes):
+    if args.serve:
+        _configure_utf8_stdio()
+        serve(sys.stdin, sys.stdout, incremental=args.incremental)
+        return
+
+    if args.batch:
+        _configure_utf8_stdio()
+        if not args.paths:
+            sys.stderr.write("Usage: python parse_python.py --batch <path|dir|glob> [...]\n")
+            sys.exit(1)
+        failed = run_batch(args.paths, sys.stdout, jobs=args.jobs,
+                           cache_path=cache_path, cache_max_bytes=cache_max_bytes)
+        sys.exit(1 if failed else 0)
+
+    if args.matrix:
+        _configure_utf8_stdio()
+        if not args.paths:
+            sys.stderr.write("Usage: python parse_python.py --matrix <output> <path|dir|glob> [...]\n")
+            sys.exit(1)
+        sys.exit(run_matrix(args.paths, args.matrix, sys.stdout, jobs=args.jobs,
+                            cache_path=cache_path, cache_max_bytes=cache_max_bytes))
+
+    if args.index:
+        _configure_utf8_stdio()
+        if not args.paths:
+            sys.stderr.write("Usage: python parse_python.py --index <db> [--query] <path|dir|glob> [...]\n")
+            sys.exit(1)
+        sys.exit(run_index(args.paths, args.index, sys.stdout, query=args.query, top_k=args.top_k,
+                           jobs=args.jobs, cache_path=cache_path, cache_max_bytes=cache_max_bytes))
+
+    if len(args.paths) != 1:
+        sys.stderr.write("Usage: python parse_python.py <file_path>\n")
+        sys.exit(1)
+    if _output_format != 'text':
+        # Ошибки чтения и разбора - в самой записи, а не в stderr
+        _configure_utf8_stdio()
+        record = analyze_path_to_record(args.paths[0])
+        write_record(sys.stdout, record)
+        sys.exit(0 if record["ok"] else 1)
+    run_single_file(args.paths[0])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+# Scripts/halstead_incremental.py
+# Инкрементальный пересчёт метрик Холстеда для часто редактируемых файлов.
+# Файл делится на фрагменты по инструкциям верхнего уровня; для каждого фрагмента
+# хранится отпечаток текста и частичный результат (мультимножества операторов и операндов).
+# При повторном анализе заново обходятся только изменившиеся фрагменты.
+import io
+import re
+import hashlib
+from collections import Counter, OrderedDict
+
+# Строки без отступа, которые продолжают предыдущую инструкцию, а не начинают новую
+_CONTINUATION_RE = re.compile(r"(?:else|elif|except|finally)\b|[)\]}#]")
+
+DEFAULT_MAX_FILES = 64 # Сколько файлов держать в памяти одновременно (LRU)
+
+
+class Multiset(Counter):
+    # Counter с методом add, чтобы обходчик AST мог работать с ним так же, как с set.
+    # Кратность - число вхождений; уникальные элементы - ключи с положительным счётчиком.
+    def add(self, item):
+        self[item] += 1
+
+
+def split_top_level(code_string):
+    # Возвращает фрагменты [(номер первой строки, текст)], каждый начинается со строки
+    # без отступа. Разбиение эвристическое: если граница попала внутрь многострочной
+    # строки или скобок, фрагмент не разберётся отдельно и будет объединён со следующим.
+    chunks = []
+    current = []
+    start_line = 1
+    after_decorator = False
+    # newline='' - делим по \n, \r и \r\n, как токенизатор Python, не меняя текст
+    for number, line in enumerate(io.StringIO(code_string, newline='').readlines(), 1):
+        starts_statement = line[:1] not in ('', ' ', '\t', '\n', '\r', '\f') \
+            and not _CONTINUATION_RE.match(line)
+        if starts_statement:
+            if not after_decorator and current:
+                chunks.append((start_line, ''.join(current)))
+                current = []
+                start_line = number
+            after_decorator = line.startswith('@') # Декораторы остаются вместе с def/class
+        current.append(line)
+    if current:
+        chunks.append((start_line, ''.join(current)))
+    return chunks
+
+
+def fingerprint(text):
+    return hashlib.blake2b(text.encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+
+
+class _FileState:
+    def __init__(self):
+        self.chunks = Counter()   # Отпечаток -> сколько одинаковых фрагментов в файле
+        self.partials = {}        # Отпечаток -> (операторы, операнды, N1, N2)
+        self.incomplete = set()   # Отпечатки фрагментов, которые не разбираются отдельно
+        self.operators = Counter()
+        self.operands = Counter()
+        self.N1 = 0
+        self.N2 = 0
+
+
+class IncrementalAnalyzer:
+    """Хранит частичные результаты по фрагментам для нескольких файлов.
+
+    analyze_chunk(text) должен вернуть (Multiset операторов, Multiset операндов, N1, N2)
+    или выбросить SyntaxError; номера строк в ошибке считаются от начала фрагмента.
+    """
+
+    def __init__(self, analyze_chunk, max_files=DEFAULT_MAX_FILES):
+        self._analyze_chunk = analyze_chunk
+        self._max_files = max_files
+        self._files = OrderedDict()
+
+    def forget(self, key):
+        self._files.pop(key, None)
+
+    def analyze(self, key, code_string):
+        # Возвращает (операторы, операнды, N1, N2, число фрагментов, число заново разобранных)
+        state = self._files.pop(key, None) or _FileState()
+        try:
+            resolved, reanalyzed = self._resolve_chunks(code_string, state)
+        except Exception:
+            self._files[key] = state # Состояние не изменилось, файл можно исправить и повторить
+            raise
+        self._files[key] = state
+        while len(self._files) > self._max_files:
+            self._files.popitem(last=False)
+
+        new_chunks = Counter(fp for fp, _ in resolved)
+        partials = dict(resolved)
+        # Вычитаем исчезнувшие фрагменты и добавляем новые - остальное не трогаем
+        for fp, count in (state.chunks - new_chunks).items():
+            self._apply(state, state.partials[fp], -count)
+        for fp, count in (new_chunks - state.chunks).items():
+            self._apply(state, partials[fp], count)
+        state.chunks = new_chunks
+        state.partials = partials
+        if len(state.incomplete) > 4 * len(new_chunks) + 16: # Не даём множеству расти без предела
+            state.incomplete.clear()
+
+        return (set(+state.operators), set(+state.operands), state.N1, state.N2,
+                len(resolved), reanalyzed)
+
+    @staticmethod
+    def _apply(state, partial, times):
+        operators, operands, N1, N2 = partial
+        for _ in range(abs(times)):
+            if times > 0:
+                state.operators.update(operators)
+                state.operands.update(operands)
+            else:
+                state.operators.subtract(operators)
+                state.operands.subtract(operands)
+        state.N1 += N1 * times
+        state.N2 += N2 * times
+        # Убираем элементы с нулевой кратностью, чтобы словарь не рос от правки к правке
+        if times < 0:
+            state.operators = +state.operators
+            state.operands = +state.operands
+
+    def _resolve_chunks(self, code_string, state):
+        raw = split_top_level(code_string)
+        resolved = []
+        reanalyzed = 0
+        index = 0
+        while index < len(raw):
+            span = 1
+            while True:
+                text = ''.join(chunk for _, chunk in raw[index:index + span])
+                fp = fingerprint(text)
+                partial = state.partials.get(fp)
+                if partial is not None:
+                    break
+                at_end = index + span >= len(raw)
+                if fp not in state.incomplete or at_end:
+                    try:
+                        partial = self._analyze_chunk(text)
+                        reanalyzed += 1
+                        break
+                    except SyntaxError as e:
+                        if at_end:
+                            # Ошибка в самом файле: пересчитываем номер строки от начала файла
+                            if e.lineno is not None:
+                                e.lineno += raw[index][0] - 1
+                            raise
+                        state.incomplete.add(fp)
+                # Граница попала внутрь строки или скобок: удваиваем фрагмент
+                span = min(span * 2, len(raw) - index)
+            resolved.append((fp, partial))
+            index += span
+        return resolved, reanalyzed
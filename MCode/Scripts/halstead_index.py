@@ -0,0 +1,193 @@
+# Scripts/halstead_index.py
+# Индекс MinHash/LSH для быстрого поиска похожих файлов в большом корпусе.
+# Сигнатура строится по шинглам (k подряд идущих элементов) потока операторов и операндов,
+# который выдаёт обходчик AST. Индекс хранится в SQLite и пополняется по одному файлу.
+import os
+import sqlite3
+import hashlib
+from array import array
+from collections import Counter
+
+NUM_PERM = 128          # Длина сигнатуры MinHash
+BANDS = 32              # Число полос LSH; строк в полосе - NUM_PERM // BANDS
+SHINGLE_SIZE = 5        # Элементов потока в одном шингле
+_MAX_HASH = (1 << 61) - 1
+_BIN_BITS = 7           # NUM_PERM == 1 << _BIN_BITS
+_VALUE_LIMIT = _MAX_HASH >> _BIN_BITS
+# Заимствованное из соседней ячейки значение сдвигается, чтобы не совпадать случайно
+_DENSIFY_OFFSET = 0x9E3779B97F4A7C15 & _MAX_HASH
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    signature BLOB NOT NULL,
+    unique_operators INTEGER NOT NULL,  -- n1 (имена столбцов в SQLite не различают регистр)
+    unique_operands INTEGER NOT NULL,   -- n2
+    total_operators INTEGER NOT NULL,   -- N1
+    total_operands INTEGER NOT NULL     -- N2
+);
+CREATE TABLE IF NOT EXISTS buckets (
+    band INTEGER NOT NULL,
+    bucket BLOB NOT NULL,
+    doc_id INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS buckets_lookup ON buckets(band, bucket);
+CREATE INDEX IF NOT EXISTS buckets_doc ON buckets(doc_id);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+class RecordingSet(set):
+    # set, который дополнительно запоминает порядок добавлений: из него получается
+    # поток операторов/операндов без изменения кода обходчиков
+    def __init__(self, stream, tag):
+        super().__init__()
+        self._stream = stream
+        self._tag = tag
+
+    def add(self, item):
+        self._stream.append(self._tag + item)
+        set.add(self, item)
+
+
+def shingle_hashes(stream, size=SHINGLE_SIZE):
+    # Множество 61-битных хэшей шинглов; короткий поток даёт один шингл
+    if not stream:
+        return set()
+    size = min(size, len(stream))
+    hashes = set()
+    for start in range(len(stream) - size + 1):
+        text = '\x1f'.join(stream[start:start + size]).encode('utf-8', 'surrogatepass')
+        hashes.add(int.from_bytes(hashlib.blake2b(text, digest_size=8).digest(), 'little') & _MAX_HASH)
+    return hashes
+
+
+def minhash_signature(stream, size=SHINGLE_SIZE):
+    # MinHash с одной перестановкой (one permutation hashing): младшие биты хэша выбирают
+    # ячейку, в ячейке остаётся минимум. Один проход по шинглам вместо NUM_PERM проходов.
+    # Пустые ячейки заполняются из ближайшей непустой справа (densification по кругу).
+    signature = [None] * NUM_PERM
+    for h in shingle_hashes(stream, size):
+        cell = h & (NUM_PERM - 1)
+        value = h >> _BIN_BITS
+        current = signature[cell]
+        if current is None or value < current:
+            signature[cell] = value
+    if all(value is None for value in signature):
+        return [_MAX_HASH] * NUM_PERM # Пустой файл: сигнатура похожа только на другие пустые
+    for cell in range(NUM_PERM):
+        if signature[cell] is None:
+            distance = 1
+            while signature[(cell + distance) % NUM_PERM] is None:
+                distance += 1
+            signature[cell] = _VALUE_LIMIT + (signature[(cell + distance) % NUM_PERM] +
+                                              distance * _DENSIFY_OFFSET) % _MAX_HASH
+    return signature
+
+
+def estimate_similarity(signature1, signature2):
+    # Доля совпавших позиций - оценка коэффициента Жаккара по множествам шинглов
+    return sum(1 for x, y in zip(signature1, signature2) if x == y) / NUM_PERM
+
+
+def _band_buckets(signature):
+    rows = NUM_PERM // BANDS
+    packed = array('Q', signature).tobytes()
+    width = rows * 8
+    return [(band, hashlib.blake2b(packed[band * width:(band + 1) * width], digest_size=8).digest())
+            for band in range(BANDS)]
+
+
+class LSHIndex:
+    """Индекс MinHash/LSH в файле SQLite.
+
+    Поиск смотрит только документы, совпавшие с запросом хотя бы в одной полосе,
+    поэтому его стоимость зависит от числа кандидатов, а не от размера корпуса.
+    """
+
+    def __init__(self, path, engine=None, engine_version=None):
+        # engine и engine_version попадают в meta: сигнатуры разных движков несравнимы
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.engine = engine
+        self.engine_version = engine_version
+        self._conn = sqlite3.connect(path, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._check_parameters()
+
+    def _check_parameters(self):
+        expected = {"num_perm": str(NUM_PERM), "bands": str(BANDS), "shingle_size": str(SHINGLE_SIZE),
+                    "engine": str(self.engine), "engine_version": str(self.engine_version)}
+        stored = dict(self._conn.execute("SELECT key, value FROM meta").fetchall())
+        if not stored:
+            with self._conn:
+                self._conn.executemany("INSERT INTO meta(key, value) VALUES (?, ?)", expected.items())
+        elif stored != expected:
+            raise ValueError(f"Index {self.path} was built with different parameters: {stored}")
+
+    def add(self, path, signature, counts):
+        self.add_many([(path, signature, counts)])
+
+    def add_many(self, entries):
+        # entries - [(путь, сигнатура, (n1, n2, N1, N2))]; всё пишется одной транзакцией.
+        # Повторное добавление того же пути заменяет запись.
+        with self._conn:
+            for path, signature, counts in entries:
+                self._insert(path, signature, counts)
+
+    def _insert(self, path, signature, counts):
+        row = self._conn.execute("SELECT id FROM documents WHERE path = ?", (path,)).fetchone()
+        packed = array('Q', signature).tobytes()
+        if row is None:
+            doc_id = self._conn.execute(
+                "INSERT INTO documents(path, signature, unique_operators, unique_operands, "
+                "total_operators, total_operands) VALUES (?, ?, ?, ?, ?, ?)",
+                (path, packed, *counts)).lastrowid
+        else:
+            doc_id = row[0]
+            self._conn.execute("DELETE FROM buckets WHERE doc_id = ?", (doc_id,))
+            self._conn.execute(
+                "UPDATE documents SET signature = ?, unique_operators = ?, unique_operands = ?, "
+                "total_operators = ?, total_operands = ? WHERE id = ?",
+                (packed, *counts, doc_id))
+        self._conn.executemany("INSERT INTO buckets(band, bucket, doc_id) VALUES (?, ?, ?)",
+                               [(band, bucket, doc_id) for band, bucket in _band_buckets(signature)])
+
+    def query(self, signature, top_k=10, exclude_path=None):
+        candidates = Counter()
+        for band, bucket in _band_buckets(signature):
+            for (doc_id,) in self._conn.execute(
+                    "SELECT doc_id FROM buckets WHERE band = ? AND bucket = ?", (band, bucket)):
+                candidates[doc_id] += 1
+
+        matches = []
+        ids = list(candidates)
+        for start in range(0, len(ids), 500): # Ограничение SQLite на число параметров
+            chunk = ids[start:start + 500]
+            placeholders = ','.join('?' * len(chunk))
+            for path, packed, n1, n2, N1, N2 in self._conn.execute(
+                    "SELECT path, signature, unique_operators, unique_operands, total_operators, total_operands "
+                    f"FROM documents WHERE id IN ({placeholders})",
+                    chunk):
+                if path == exclude_path:
+                    continue
+                other = array('Q')
+                other.frombytes(packed)
+                matches.append({"path": path, "similarity": estimate_similarity(signature, other),
+                                "n1": n1, "n2": n2, "N1": N1, "N2": N2})
+        matches.sort(key=lambda match: (-match["similarity"], match["path"]))
+        return matches[:top_k]
+
+    def __len__(self):
+        return self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def close(self):
+        self._conn.close()
@@ -0,0 +1,90 @@
+# Scripts/halstead_matrix.py
+# Векторизованный расчёт матрицы схожести N×N по метрикам Холстеда.
+# Формулы повторяют MetricResult и MetricAnalyzer.CalculateComponentSimilarity на стороне C#.
+import csv
+
+import numpy as np
+
+# Порядок компонент совпадает с MetricAnalyzer.Compare; True - сравнение в логарифмической шкале
+METRIC_COMPONENTS = (
+    ("n1", False),
+    ("n2", False),
+    ("N1", True),
+    ("N2", True),
+    ("V", True),
+    ("D", False),
+    ("E", True),
+)
+
+# Сколько строк матрицы считать за один проход: ограничивает размер временных массивов
+DEFAULT_BLOCK_ROWS = 512
+
+
+def metric_vectors(records):
+    # records - успешные записи parse_python.py (operators, operands, N1, N2)
+    base = np.array([[len(r["operators"]), len(r["operands"]), r["N1"], r["N2"]] for r in records],
+                    dtype=np.float64).reshape(-1, 4)
+    n1, n2, N1, N2 = base.T
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        vocabulary = n1 + n2
+        length = N1 + N2
+        # V = N * log2(n); 0, если n <= 1 или N == 0
+        volume = np.where((vocabulary <= 1) | (length == 0), 0.0, length * np.log2(np.maximum(vocabulary, 1)))
+        # L' = 2*n2 / (n1*N2); NaN, если n1 == 0 или N2 == 0
+        level = np.where((n1 == 0) | (N2 == 0), np.nan, (2.0 * n2) / (n1 * N2))
+        # E = V / L'; NaN, если L' не определён или равен 0
+        effort = np.where(np.isnan(level) | (level == 0), np.nan, volume / level)
+        # D = (n1/2) * (N2/n2); NaN, если n2 == 0
+        difficulty = np.where(n2 == 0, np.nan, (n1 / 2.0) * (N2 / n2))
+
+    columns = {"n1": n1, "n2": n2, "N1": N1, "N2": N2, "V": volume, "D": difficulty, "E": effort}
+    return np.column_stack([columns[name] for name, _ in METRIC_COMPONENTS])
+
+
+def similarity_matrix(metrics, block_rows=DEFAULT_BLOCK_ROWS):
+    # Итоговая схожесть пары - среднее по компонентам, где обе метрики определены (в процентах)
+    count = metrics.shape[0]
+    scaled = metrics.copy()
+    for column, (_, use_log) in enumerate(METRIC_COMPONENTS):
+        if use_log:
+            scaled[:, column] = np.log(scaled[:, column] + 1) # +1, чтобы избежать log(0)
+
+    result = np.empty((count, count), dtype=np.float32)
+    for start in range(0, count, block_rows):
+        rows = scaled[start:start + block_rows]
+        total = np.zeros((rows.shape[0], count))
+        valid = np.zeros((rows.shape[0], count))
+        for column in range(scaled.shape[1]):
+            a = rows[:, column][:, None]
+            b = scaled[:, column][None, :]
+            max_val = np.maximum(np.abs(a), np.abs(b))
+            with np.errstate(divide='ignore', invalid='ignore'):
+                component = np.maximum(0.0, (1.0 - np.abs(a - b) / max_val) * 100.0)
+            component = np.where(max_val == 0, 100.0, component) # Оба значения 0 - схожесть 100%
+            defined = ~(np.isnan(a) | np.isnan(b))
+            total += np.where(defined, component, 0.0)
+            valid += defined
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # Если сравнить нечего ни по одной метрике, схожесть 0 (как в C#)
+            result[start:start + rows.shape[0]] = np.where(valid > 0, total / valid, 0.0)
+
+    np.fill_diagonal(result, 100.0)
+    return result
+
+
+def save_matrix(output_path, paths, metrics, matrix):
+    # .npz - компактный двоичный формат (сжатый), иначе CSV для внешних инструментов
+    if output_path.lower().endswith('.npz'):
+        np.savez_compressed(output_path,
+                            paths=np.array(paths, dtype=str),
+                            components=np.array([name for name, _ in METRIC_COMPONENTS]),
+                            metrics=metrics,
+                            similarity=matrix)
+        return
+
+    with open(output_path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow([""] + list(paths))
+        for path, row in zip(paths, matrix):
+            writer.writerow([path] + [f"{value:.2f}" for value in row])
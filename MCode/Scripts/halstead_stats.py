@@ -0,0 +1,108 @@
+# Scripts/halstead_stats.py
+# Вспомогательные средства для режима --stats: время по фазам и обработчикам узлов,
+# число узлов AST по типам и пиковое потребление памяти процессом.
+import ast
+import sys
+import time
+from collections import Counter
+
+
+def new_stats():
+    # Заготовка записи статистики; фазы добавляются по мере выполнения
+    return {"phases": {}}
+
+
+def add_phase(stats, name, seconds):
+    if stats is not None:
+        phases = stats["phases"]
+        phases[name] = phases.get(name, 0.0) + seconds
+
+
+class HandlerProfiler:
+    """Считает вызовы и собственное время обработчиков узлов.
+
+    Время вложенных обработчиков (рекурсивный visitor) вычитается из времени
+    внешнего, поэтому сумма по обработчикам не превышает времени обхода.
+    """
+
+    def __init__(self):
+        self.calls = Counter()
+        self.times = Counter()
+        self._children = [] # Время вложенных вызовов для каждого активного обработчика
+
+    def wrap(self, name, handler):
+        calls, times, children = self.calls, self.times, self._children
+        clock = time.perf_counter
+
+        def timed(*args):
+            children.append(0.0)
+            start = clock()
+            try:
+                return handler(*args)
+            finally:
+                elapsed = clock() - start
+                times[name] += elapsed - children.pop()
+                calls[name] += 1
+                if children:
+                    children[-1] += elapsed
+        return timed
+
+    def instrument_table_walker(self, walker):
+        walker._handlers = {cls: self.wrap(cls.__name__, handler)
+                            for cls, handler in walker._handlers.items()}
+
+    def instrument_visitor(self, visitor):
+        # NodeVisitor ищет visit_* через getattr, поэтому атрибуты экземпляра перекрывают методы класса
+        for attribute in dir(type(visitor)):
+            if attribute.startswith('visit_'):
+                setattr(visitor, attribute, self.wrap(attribute[len('visit_'):], getattr(visitor, attribute)))
+
+    def report(self):
+        return {name: {"calls": self.calls[name], "time_s": self.times[name]}
+                for name in sorted(self.times, key=self.times.get, reverse=True)}
+
+
+def count_nodes(tree):
+    # ast.walk итеративен, поэтому глубокие деревья ему не мешают
+    return dict(Counter(type(node).__name__ for node in ast.walk(tree)).most_common())
+
+
+def peak_rss_bytes():
+    # Пиковый размер рабочего набора процесса с момента запуска; None, если узнать нельзя
+    if sys.platform == 'win32':
+        return _peak_rss_windows()
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # В Linux ru_maxrss в килобайтах, в macOS - в байтах
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _peak_rss_windows():
+    import ctypes
+    from ctypes import wintypes
+
+    class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+        _fields_ = [("cb", wintypes.DWORD),
+                    ("PageFaultCount", wintypes.DWORD),
+                    ("PeakWorkingSetSize", ctypes.c_size_t),
+                    ("WorkingSetSize", ctypes.c_size_t),
+                    ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+                    ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                    ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+                    ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                    ("PagefileUsage", ctypes.c_size_t),
+                    ("PeakPagefileUsage", ctypes.c_size_t)]
+
+    counters = PROCESS_MEMORY_COUNTERS()
+    counters.cb = ctypes.sizeof(counters)
+    kernel32 = ctypes.WinDLL('kernel32')
+    kernel32.GetCurrentProcess.restype = wintypes.HANDLE
+    get_info = kernel32.K32GetProcessMemoryInfo
+    get_info.argtypes = [wintypes.HANDLE, ctypes.POINTER(PROCESS_MEMORY_COUNTERS), wintypes.DWORD]
+    get_info.restype = wintypes.BOOL
+    if not get_info(kernel32.GetCurrentProcess(), ctypes.byref(counters), counters.cb):
+        return None
+    return counters.PeakWorkingSetSize